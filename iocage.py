@@ -65,7 +65,9 @@ options:
         fetched: iocage fetch [-U] [-r release] [-F components] [-P plugin]
         get: iocage get --all <name>
         pkg: iocage pkg <name> <cmd>
+        plan: none. Return the commands of O(operations)
         present: iocage create [-n name] [-r release] [-p pkglist] [args] [properties]
+        progress: read O(progress_file)
         restarted: iocage restart [args] [name]
         set: iocage set <properties> <name>
         started: iocage start [args] [name]
@@ -108,6 +110,48 @@ options:
       description:
         - Execute the command O(cmd) inside the specified jail O(name).
       type: str
+    cmds:
+      description:
+        - List of commands to execute in the specified jail O(name). Use it instead of O(cmd).
+        - The commands run in order by C(/bin/sh) in one C(iocage exec) session. Each command runs in
+          a subshell.
+        - The return code, stdout, and stderr of each command are returned in RV(commands).
+        - The module fails if any command fails.
+      type: list
+      elements: str
+    stop_on_error:
+      description:
+        - Do not execute the next commands in O(cmds) if a command fails.
+      type: bool
+      default: false
+    exec_backend:
+      description:
+        - How to execute the commands of the states V(exec, pkg) in the running jail.
+        - V(iocage) uses C(iocage exec -u <user> <name> --) and C(iocage pkg <name>).
+        - V(jexec) uses C(jexec -u <user> <jid>) and C(pkg -j <jid>) with the JID of the jail
+          gathered by C(iocage list). This avoids the start of the iocage CLI. V(iocage) is used
+          if the utility C(jexec) or C(pkg) is not found.
+      type: str
+      choices: [iocage, jexec]
+      default: iocage
+    packages:
+      description:
+        - List of packages for B(state=pkg). Use it instead of O(cmd).
+        - The packages are names or origins, for example C(nginx) or C(www/nginx).
+        - The installed packages are queried once by C(pkg query). All packages are installed
+          by one C(pkg install) and deleted by one C(pkg delete).
+      type: list
+      elements: str
+    package_state:
+      description:
+        - State of the O(packages).
+        - V(present) installs the missing packages.
+        - V(absent) deletes the installed packages.
+        - V(latest) installs the missing packages and upgrades the installed ones. The installed
+          packages older than the repository are listed by C(pkg version -R -l '<') first.
+      type: str
+      choices: [present, absent, latest]
+      default: present
     clone_from:
       description:
         - Use B(state=cloned).
@@ -117,6 +161,47 @@ options:
         - Use O(args) to configure the C(iocage) command.
         - Use O(pkglist) if O(clone_from) is a template.
       type: str
+    count:
+      description:
+        - Number of jails to clone from O(clone_from) in B(state=cloned). Use it instead of O(name).
+        - The facts are gathered once. The missing jails are created concurrently. See O(max_parallel).
+          The properties of the existing jails are set. See O(jail_properties).
+        - The results per jail are returned in RV(jails). The created jails are returned in RV(created).
+      type: int
+    name_pattern:
+      description:
+        - Pattern of the names of the jails cloned if O(count) is used. The pattern is formatted by
+          the index of the jail 1..O(count). For example, V(web%03d) gives C(web001, web002, ...).
+        - If O(name_pattern) is not defined O(count) new jails are created. The UUID is the name of
+          the jail. The jails are not renamed to C(uuid_short).
+      type: str
+    jail_properties:
+      description:
+        - 'Dictionary of the properties per jail C({name: {property: value}}).'
+        - The properties of a jail are combined with O(properties) if O(count) is used.
+        - In B(state=set), use it instead of O(name). The properties of all jails are read at once
+          and combined with O(properties). The changed properties are set concurrently. See
+          O(max_parallel). The running jails that need a restart because of a changed property
+          C(ip4_addr, ip6_addr, template, interfaces, vnet, host_hostname) are stopped by one
+          command before and started by one command after the properties are set.
+        - The results per jail are returned in RV(jails).
+      type: dict
+    operations:
+      description:
+        - List of the operations evaluated by B(state=plan). Nothing is changed on the remote host.
+        - 'Each operation is a dictionary with the key C(op) and the keys C(name, properties,
+          clone_from, release, components, pkglist, args) that have the meaning of the options.'
+        - C(op) is one of C(create, clone, set, start, stop, restart, absent, fetch). C(name) is
+          required except for C(fetch). C(clone_from) is required for C(clone). The default
+          C(release) is the release of the remote host.
+        - The operations are applied one by one to the gathered jails, templates, and releases.
+          The properties are read only for the jails the operations set. Use O(facts_cache) and
+          O(properties_backend=config) to plan without running iocage.
+        - The properties of a jail created by the plan are not known. All properties set by a
+          later operation are planned.
+        - The commands and the predicted changes are returned in RV(plan).
+      type: list
+      elements: dict
     plugin:
       description:
         - Specify which plugin to fetch or update.
@@ -140,15 +225,243 @@ options:
       type: list
       elements: path
       aliases: [files, component]
+    components_cache:
+      description:
+        - Directory of the local cache of the release components.
+        - If defined, the components of O(release) are copied from O(components_mirror) to the
+          cache, verified by SHA-256 against the C(MANIFEST) of the release, and fetched by
+          C(iocage fetch -d <components_cache>/releases). The verified components are not copied again.
+        - The components are stored once in C(<components_cache>/sha256/<digest>) and linked to
+          C(<components_cache>/releases/<release>/<component>).
+        - The default components are C(base.txz, lib32.txz, src.txz) if listed in the C(MANIFEST).
+        - Not used if O(plugin) is defined.
+      type: path
+    components_mirror:
+      description:
+        - Local directory or C(file://) URL of the mirror of the releases, for example
+          C(file:///mnt/freebsd/releases/amd64). The components are read from C(<mirror>/<release>/).
+        - If not defined, the C(MANIFEST) and the components already in O(components_cache) are used.
+      type: str
+    facts_workers:
+      description:
+        - Maximal number of concurrent C(iocage get --all) commands that collect the properties of
+          the jails and templates when the facts are gathered.
+        - V(1) collects the properties serially.
+      type: int
+      default: 4
+    gather:
+      description:
+        - List of the facts to gather.
+        - V(all) gathers all facts B(iocage_jails), B(iocage_plugins), B(iocage_templates),
+          B(iocage_releases), and the properties of the jails and templates.
+        - V(minimal) gathers only the facts the O(state) needs. For example, V(exec, pkg, get, set)
+          need the lists of jails and templates without the properties. V(facts) needs nothing.
+        - V(jails, templates, plugins, releases) gather the lists in addition to the facts the
+          O(state) needs.
+        - V(properties) collects the properties of the gathered jails and templates.
+        - Only the gathered facts are returned in RV(ansible_facts).
+      type: list
+      elements: str
+      choices: [all, minimal, jails, templates, plugins, releases, properties]
+      default: [all]
+    facts_format:
+      description:
+        - Format of the facts B(iocage_jails), B(iocage_templates), B(iocage_plugins), and
+          B(iocage_releases) returned in RV(ansible_facts).
+        - V(full) returns all columns of C(iocage list) and the properties of the jails and templates.
+        - V(compact) returns only the columns that are not empty (C(-)). The properties are
+          collected and returned only if O(facts_properties) is defined.
+        - V(none) returns none of these facts. Only the facts the O(state) needs are gathered. See
+          O(gather).
+      type: str
+      choices: [full, compact, none]
+      default: full
+    facts_properties:
+      description:
+        - List of the properties of the jails and templates returned in the attribute C(properties)
+          of the facts. The other properties are skipped when the properties are read.
+        - By default, all properties are returned if O(facts_format=full).
+        - Doesn't change B(iocage_properties) of the state V(get).
+      type: list
+      elements: str
+    facts_since:
+      description:
+        - Fingerprint RV(iocage_delta.fingerprint) of the facts returned by a previous run.
+        - If the snapshot of the fingerprint is found in O(facts_cache_dir) the gathered facts
+          B(iocage_jails), B(iocage_templates), B(iocage_plugins), and B(iocage_releases) are not
+          returned in RV(ansible_facts). Only the jails, templates, plugins, and releases added,
+          removed, or changed since the fingerprint are returned in RV(iocage_delta).
+        - Otherwise, or if a gathered section is not in the snapshot, all facts are returned in
+          full and RV(iocage_delta.full) is V(true).
+        - Use an empty string to get the first fingerprint.
+        - The snapshot of the facts is a dictionary of the SHA-256 hashes per jail, template, plugin,
+          and release. The last 16 snapshots are kept.
+      type: str
+    properties_backend:
+      description:
+        - How to read the properties of the jails and templates.
+        - V(cli) runs C(iocage get --all <name>) for each jail.
+        - V(config) reads the files C(jails/<name>/config.json) or C(templates/<name>/config.json)
+          in the O(iocroot) directory and merges them with C(defaults.json) the same way iocage
+          does. If the file of a jail can not be read C(iocage get --all <name>) is used instead.
+      type: str
+      choices: [cli, config]
+      default: cli
+    properties_writer:
+      description:
+        - How to set the properties of the jails and templates that are not running.
+        - V(cli) runs C(iocage set) and passes the properties of a created jail to C(iocage create).
+        - V(config) writes the changed properties directly to the file C(config.json) of the jail or
+          template in the O(iocroot) directory. The file is replaced atomically. The previous content
+          is kept in C(config.json.bak). Only the properties listed by C(iocage get --all) are written.
+          The other properties, the properties with side effects, for example C(template, release,
+          basejail, jail_zfs, quota), and the properties of the running jails are set by C(iocage set).
+          C(iocage set) is used also if the file can not be written.
+        - The properties of a created jail are written after C(iocage create). If O(pkglist) is
+          set, all properties are passed to C(iocage create) because it starts the jail to install
+          the packages.
+        - V(config) falls back to V(cli) if the iocage root can not be found.
+      type: str
+      choices: [cli, config]
+      default: cli
+    iocroot:
+      description:
+        - Mountpoint of the iocage dataset. Used by O(properties_backend=config) and
+          O(properties_writer=config).
+        - By default, the mountpoint of the dataset C(<pool>/iocage) is used, where C(<pool>) has
+          the property C(org.freebsd.ioc:active=yes). O(properties_backend=config) falls back to
+          V(cli) if the pool can not be found.
+      type: path
+    names:
+      description:
+        - List of jails. Use it instead of O(name) in the states V(started, stopped, restarted, absent).
+        - The facts are gathered once. The jails already in the target state are skipped. The
+          operations on the other jails run concurrently. See O(max_parallel).
+        - The results and timings per jail are returned in RV(jails).
+      type: list
+      elements: str
+    max_parallel:
+      description:
+        - Maximal number of concurrent operations on the jails O(names), or on the jails of one tier
+          if O(parallel=true).
+      type: int
+      default: 4
+    parallel:
+      description:
+        - Start or stop the jails in tiers if V(true). Applies to the states V(started, stopped) if
+          O(name=ALL) or O(args) contains C(--rc).
+        - O(name=ALL) selects all jails. C(--rc) selects the jails with C(boot=on).
+        - The tiers are ordered by the jail property C(priority). The jails with smaller value of
+          C(priority) start first and stop last. A jail starts after the jails in C(depends) and
+          stops before them. A jail that depends on a jail of greater C(priority) is scheduled in
+          the C(priority) of that jail.
+          iocage starts the dependencies of a jail anyway.
+        - The jails of a tier start or stop concurrently. See O(max_parallel). The next tier starts
+          when all jails of the tier are verified up or down.
+        - The tiers, results per jail, and durations are returned in RV(schedule) and RV(jails).
+      type: bool
+      default: false
+    restart:
+      description:
+        - How to restart a running jail after a change of the properties C(ip4_addr, ip6_addr,
+          template, interfaces, vnet, host_hostname) in the states V(set, present, cloned).
+        - V(immediate) stops the jail, sets the properties, and starts the jail.
+        - V(deferred) sets the properties and records the pending restart in the file
+          C(<pending_dir>/<name>.json) on the remote host. Restart the jails later by
+          B(state=restarted) and O(pending_only=true).
+        - V(soft) sets the properties and runs C(iocage restart -s) if only C(host_hostname) changed.
+          C(iocage restart -s) doesn't tear down the network stack. V(immediate) is used otherwise.
+        - V(never) sets the properties only.
+        - The pending restart of a jail is cleared when the module stops, restarts, or destroys the jail.
+      type: str
+      choices: [immediate, deferred, soft, never]
+      default: immediate
+    pending_dir:
+      description:
+        - Directory of the pending restarts on the remote host. See O(restart=deferred).
+      type: path
+      default: /var/db/ansible-iocage/pending
+    pending_only:
+      description:
+        - Restart only the jails with a pending restart in B(state=restarted). See O(restart=deferred).
+        - All jails with a pending restart are selected if neither O(name) nor O(names) are
+          defined or if O(name=ALL). The pending restart of a jail that is not running is cleared.
+        - The jails are restarted concurrently. See O(max_parallel). The results per jail are
+          returned in RV(jails).
+      type: bool
+      default: false
+    facts_cache:
+      description:
+        - Cache the gathered facts and the release of the remote host in O(facts_cache_dir).
+        - A cached fact is used if it is not older than O(facts_cache_ttl) and if the modification
+          times of the iocage root, its directories C(jails), C(templates), C(releases), the file
+          C(defaults.json), and of the files C(config.json) of all jails and templates did not
+          change. The modification times are not tested if the iocage root is not known. See O(iocroot).
+        - The module invalidates the cached facts it changes, for example, when a jail is created,
+          set, started, stopped, or destroyed, or when a release is fetched.
+        - Starting and stopping a jail does not change any C(config.json). The state and the JID of
+          the cached jails and plugins are refreshed by C(jls), or by C(iocage list -h) if C(jls) is
+          not available.
+      type: bool
+      default: false
+    facts_cache_dir:
+      description:
+        - Directory of the cache. See O(facts_cache).
+      type: path
+      default: /var/cache/ansible-iocage
+    facts_cache_ttl:
+      description:
+        - Maximal age of the cached facts in seconds. See O(facts_cache).
+      type: int
+      default: 300
+    progress_file:
+      description:
+        - File on the remote host where the progress of C(iocage fetch) and C(iocage update) is written.
+        - If defined, stdout and stderr of the commands are read incrementally. Each line is appended
+          to the file as a JSON object with the attributes C(time, stream, line, phase, percent).
+          The last object has C(done=true) and the return code C(rc).
+        - The phases are C(download, verify, extract, install). See RV(progress).
+        - Use B(state=progress) to read the progress of a module running in the background by O(async).
+      type: path
+    output:
+      description:
+        - How to keep the output of the commands of the states V(exec, pkg, fetched) returned in
+          RV(stdout) and RV(stderr). O(cmds) are not affected.
+        - V(full) keeps all output.
+        - V(tail:N) keeps only the last C(N) lines of stdout and stderr in a ring buffer.
+        - V(summary) keeps only the numbers of the lines and bytes. See RV(output).
+        - V(file:<path>) writes stdout and stderr to the file C(<path>) on the remote host.
+        - If not V(full) the output is read incrementally and not accumulated in memory.
+      type: str
+      default: full
+    timings:
+      description:
+        - Return RV(timings) of the phases and the commands. Enabled also if debugging is set
+          E(ANSIBLE_DEBUG=true).
+      type: bool
+      default: false
+    profile:
+      description:
+        - Write the C(cProfile) statistics of the module run to O(profile_file) on the remote host.
+        - Read the statistics by C(python -m pstats <profile_file>).
+      type: bool
+      default: false
+    profile_file:
+      description:
+        - Path of the C(cProfile) statistics. See O(profile).
+      type: path
+      default: /tmp/ansible-iocage.prof
 requirements:
   - lang/python >= 3.6
   - sysutils/iocage
 notes:
   - Supports C(check_mode).
   - There is no mandatory option.
-  - The module always creates facts B(iocage_releases), B(iocage_templates), B(iocage_jails), and
-    B(iocage_plugins)
-  - Returns B(module_args) when debugging is set E(ANSIBLE_DEBUG=true)
+  - By default, the module creates facts B(iocage_releases), B(iocage_templates), B(iocage_jails), and
+    B(iocage_plugins). See O(gather).
+  - Returns B(module_args), B(command_cache), and B(timings) when debugging is set E(ANSIBLE_DEBUG=true)
+  - After V(started, stopped, restarted) the state of the jails is verified by a single C(jls --libxo json)
+    call. The facts of jails are refreshed by C(iocage list) if C(jls) is not available.
 seealso:
   - name: iocage - A FreeBSD Jail Manager
     description: iocage 1.2 documentation
@@ -183,6 +496,29 @@ EXAMPLES = r'''
       {{ iocage_templates.keys() | list }}
       {{ iocage_jails.keys() | list }}
 
+- name: Execute command in running jail. Gather only the lists of jails and templates.
+  iocage:
+    state: exec
+    name: foo
+    cmd: service sshd status
+    gather: minimal
+
+- name: Create Ansible facts iocage_jails and iocage_templates without properties.
+  iocage:
+    gather: [minimal, jails, templates]
+
+- name: Create compact facts iocage_jails and iocage_templates with the properties boot and notes only.
+  iocage:
+    gather: [minimal, jails, templates, properties]
+    facts_format: compact
+    facts_properties: [boot, notes]
+
+- name: Start all jails. Don't return the facts.
+  iocage:
+    state: started
+    name: ALL
+    facts_format: none
+
 - name: Fetch the remote host's version of base
   iocage:
     state: fetched
@@ -198,6 +534,13 @@ EXAMPLES = r'''
     release: 13.0-RELEASE
     components: 'base.txz,doc.txz'
 
+- name: Fetch the base 13.0-RELEASE from NFS mirror. Keep the verified components in the local cache.
+  iocage:
+    state: fetched
+    release: 13.0-RELEASE
+    components_cache: /var/cache/iocage
+    components_mirror: file:///mnt/freebsd/releases/amd64
+
 - name: Fetch plugin Tarsnap. Keep jails on failure.
   iocage:
     state: fetched
@@ -234,6 +577,12 @@ EXAMPLES = r'''
     state: started
     args: '--rc'
 
+- name: Start all jails with boot=on. Start the jails of the same priority concurrently.
+  iocage:
+    state: started
+    args: '--rc'
+    parallel: true
+
 - name: Stop jail
   iocage:
     state: stopped
@@ -249,6 +598,25 @@ EXAMPLES = r'''
     state: stopped
     args: '--rc'
 
+- name: Start jails foo, bar, and baz. Start up to 2 jails at once.
+  iocage:
+    state: started
+    names: [foo, bar, baz]
+    max_parallel: 2
+
+- name: Clone jails web001-web030 from the template. Create up to 8 jails at once.
+  iocage:
+    state: cloned
+    clone_from: mytemplate
+    count: 30
+    name_pattern: web%03d
+    max_parallel: 8
+    properties:
+      boot: 'on'
+    jail_properties:
+      web001:
+        ip4_addr: "em0|10.1.0.101/24"
+
 - name: Restart jail
   iocage:
     state: restarted
@@ -268,6 +636,57 @@ EXAMPLES = r'''
       defaultrouter: 10.1.0.10
       ip4_addr: 'vnet0|10.1.0.199/24'
 
+- name: Change the IP address and the hostname of the jail foo. Restart the jail once at the end.
+  iocage:
+    state: set
+    name: foo
+    properties: "{{ item }}"
+    restart: deferred
+  loop:
+    - ip4_addr: 'vnet0|10.1.0.197/24'
+    - host_hostname: foo.example.org
+
+- name: Restart the jails with a pending restart
+  iocage:
+    state: restarted
+    pending_only: true
+
+- name: Set the notes of the stopped jail foo. Write config.json instead of running iocage set.
+  iocage:
+    state: set
+    name: foo
+    properties:
+      notes: maintenance
+    properties_writer: config
+
+- name: Set the properties of the jails foo and bar. Enable boot on both.
+  iocage:
+    state: set
+    properties:
+      boot: 'on'
+    jail_properties:
+      foo:
+        notes: frontend
+      bar:
+        ip4_addr: 'vnet0|10.1.0.198/24'
+
+- name: Plan the creation of the jail foo and the change of the jail bar. Change nothing.
+  iocage:
+    state: plan
+    operations:
+      - op: clone
+        name: foo
+        clone_from: mytemplate
+        properties:
+          ip4_addr: 'vnet0|10.1.0.196/24'
+      - op: start
+        name: foo
+      - op: set
+        name: bar
+        properties:
+          notes: frontend
+  register: result
+
 - name: Create jail without cloning, install packages, and set properties.
         Use release of the remote host.
   iocage:
@@ -321,12 +740,61 @@ EXAMPLES = r'''
     name: foo
     cmd: service sshd start
 
+- name: Execute commands in running jail in one session. Stop on the first failure.
+  iocage:
+    state: exec
+    name: foo
+    cmds:
+      - sysrc sshd_enable=YES
+      - service sshd start
+    stop_on_error: true
+
+- name: Execute command in running jail by jexec
+  iocage:
+    state: exec
+    name: foo
+    cmd: service sshd status
+    exec_backend: jexec
+
+- name: Install packages in running jail
+  iocage:
+    state: pkg
+    name: foo
+    packages:
+      - nginx
+      - security/sudo
+
 - name: Execute pkg command in running jail
   iocage:
     state: pkg
     name: foo
     cmd: info
 
+- name: Update the jail in the background. Poll the progress.
+  iocage:
+    state: present
+    name: foo
+    bupdate: true
+    progress_file: /tmp/iocage-update-foo.json
+  async: 3600
+  poll: 0
+
+- name: Read the progress of the update
+  iocage:
+    state: progress
+    progress_file: /tmp/iocage-update-foo.json
+  register: result
+  until: result.progress.done
+  retries: 360
+  delay: 10
+
+- name: Upgrade packages in running jail. Return only the last 20 lines of the output.
+  iocage:
+    state: pkg
+    name: foo
+    cmd: upgrade -y
+    output: tail:20
+
 - name: Destroy jail
   iocage:
     state: absent
@@ -349,47 +817,221 @@ ansible_facts:
   contains:
     iocage_releases:
       description: List of all bases.
-      returned: always
+      returned: if gathered
       type: list
       elements: str
       sample: ['13.3-RELEASE', '13.4-RELEASE']
     iocage_templates:
-      description: Dictionary of all templates.
-      returned: always
+      description: Dictionary of all templates. See O(facts_format) and O(facts_properties).
+      returned: if gathered
       type: dict
       sample: {}
     iocage_jails:
-      description: Dictionary of all jails.
-      returned: always
+      description: Dictionary of all jails. See O(facts_format) and O(facts_properties).
+      returned: if gathered
       type: dict
       sample: {}
     iocage_plugins:
       description: Dictionary of all plugins.
-      returned: always
+      returned: if gathered
       type: dict
       sample: {}
 module_args:
   description: Information on how the module was invoked.
   returned: debug
   type: dict
+jails:
+  description:
+    - Results per jail of the states V(started, stopped, restarted, absent) if O(names) is used.
+    - Results per jail of the state V(cloned) if O(count) is used. The attribute C(uuid) is the
+      UUID of the created jail.
+    - Results per jail of the state V(set) if O(jail_properties) is used. The attribute
+      C(properties) are the changed properties, C(restart) is the restart of the running jail
+      V(immediate, soft, deferred, never), or V(null) if not needed. See O(restart).
+    - The attribute C(elapsed) is the duration of the operation in seconds.
+  returned: if O(names), O(count), or O(jail_properties) is used
+  type: dict
+  sample: {"foo": {"changed": true, "msg": "Jail 'foo' started.", "cmd": ["iocage start foo"], "rc": 0,
+           "stdout": "* Starting foo\n", "stderr": "", "elapsed": 2.312},
+           "bar": {"changed": false, "msg": "Jail 'bar' already started."}}
+created:
+  description: Names of the jails created if O(count) is used.
+  returned: if O(count) is used
+  type: list
+  elements: str
+  sample: [web001, web002, web003]
+commands:
+  description:
+    - Results of the commands O(cmds) in the order of execution. The commands not executed because
+      of O(stop_on_error=true) are not listed.
+  returned: if O(cmds) is used and not in check mode
+  type: list
+  elements: dict
+  sample: [{"cmd": "sysrc sshd_enable=YES", "rc": 0, "stdout": "sshd_enable: NO -> YES", "stderr": ""}]
+schedule:
+  description:
+    - Tiers of the jails started or stopped if O(parallel=true).
+    - The attribute C(elapsed) of a tier is the duration of its slowest jail in seconds.
+      C(critical_path) is the sum of them. C(elapsed) is the duration of all tiers including
+      the verification.
+  returned: if O(parallel=true)
+  type: dict
+  sample: {"tiers": [{"jails": ["dns"], "priority": 1, "elapsed": 2.1},
+                     {"jails": ["www", "db"], "priority": 10, "elapsed": 3.4}],
+           "critical_path": 5.5, "elapsed": 6.2}
+command_cache:
+  description:
+    - Numbers of the read-only commands, for example C(iocage list) and C(iocage get), that were
+      found (hits) or not found (misses) in the cache of the commands that already ran. The cache is
+      cleared by any command that may change the jails.
+  returned: debug
+  type: dict
+  sample: {"hits": 1, "misses": 5}
+timings:
+  description:
+    - C(phases) are the durations of the phases C(gather) (facts), C(action) (input validation and
+      the commands of the state), and C(verify) (refresh of the facts after the change), and their
+      C(total) in seconds.
+    - C(commands) are the commands in the order of execution with the phase, the duration, and
+      the return code. The commands found in the cache are not listed. See RV(command_cache).
+    - C(counts) are the numbers of the commands by the utility and the subcommand.
+  returned: if O(timings=true) or debug
+  type: dict
+  sample: {"phases": {"gather": 1.204, "action": 2.311, "verify": 0.102, "total": 3.617},
+           "commands": [{"cmd": "iocage list -hl", "phase": "gather", "elapsed": 0.412, "rc": 0}],
+           "counts": {"iocage list": 4, "iocage get": 3, "iocage start": 1, "jls": 1}}
+output:
+  description:
+    - Summary of the output of the command if O(output) is not V(full). C(truncated) is returned by V(tail:N)
+      and C(file) by V(file:<path>).
+  returned: if O(output) is not V(full)
+  type: dict
+  sample: {"mode": "tail", "rc": 0, "stdout_lines": 3125, "stdout_bytes": 201442, "stderr_lines": 0,
+           "stderr_bytes": 0, "truncated": true}
+progress:
+  description:
+    - Progress of the command in O(progress_file). C(line) is the last line of the output, C(lines)
+      the number of lines. C(phase) and C(percent) are the last parsed ones.
+  returned: B(state=progress)
+  type: dict
+  sample: {"cmd": "iocage update foo", "phase": "install", "percent": 45, "line": "Installing updates...",
+           "lines": 12, "elapsed": 73.2, "done": false, "rc": null}
+pending:
+  description: Names of the jails with a pending restart after the run. See O(restart=deferred).
+  returned: if O(restart=deferred) or O(pending_only=true)
+  type: list
+  elements: str
+  sample: [foo, bar]
+plan:
+  description:
+    - Results of O(operations) in the order of execution. The commands C(cmd) are the commands the
+      states would run. C(config.json k=v) is written to C(config.json). See O(properties_writer).
+    - C(changed) predicts the change. The module itself always reports no change.
+  returned: B(state=plan)
+  type: list
+  elements: dict
+  sample: [{"op": "clone", "name": "foo", "changed": true, "msg": "Jail would be created.",
+            "cmd": ["iocage create -n foo -t mytemplate ip4_addr=\"vnet0|10.1.0.196/24\""]},
+           {"op": "start", "name": "foo", "changed": true, "msg": "Jail 'foo' would be started.",
+            "cmd": ["iocage start foo"]}]
+iocage_delta:
+  description:
+    - Changes of the facts since O(facts_since). C(fingerprint) is the fingerprint of the returned
+      facts. Use it in O(facts_since) of the next run.
+    - C(full) is V(true) if the facts are returned in full in RV(ansible_facts).
+    - C(jails), C(templates), and C(plugins) are returned if changed. C(changed) are the added
+      and changed items. C(removed) are the names of the removed ones.
+    - C(releases) are returned if changed. C(added) and C(removed) are lists of releases.
+  returned: if O(facts_since) is defined
+  type: dict
+  sample: {"fingerprint": "5b0e9a1f2c7d4e8a0b3c6d9e1f2a4b7c", "since": "8c1d0e6f3a2b5c7d9e0f1a3b5c7d9e1f",
+           "full": false, "jails": {"changed": {"www": {"jid": "3", "state": "up"}}, "removed": ["old"]},
+           "releases": {"added": ["14.1-RELEASE"], "removed": []}}
 '''
 
+import atexit
+import cProfile
+import hashlib
 import json
+import os
 import re
+import selectors
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+import uuid
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils._text import to_bytes
-
-
-def _all_jails_started(facts):
-    '''Test all jail started.'''
-    states = set([facts['iocage_jails'][jail]['state'] for jail in facts['iocage_jails'].keys()])
+from ansible.module_utils._text import to_bytes, to_text
+
+GATHER_ALL = ('jails', 'plugins', 'templates', 'releases', 'properties')
+
+# Properties that need a restart of a running jail
+RESTART_PROPERTIES = ('ip4_addr', 'ip6_addr', 'template', 'interfaces', 'vnet', 'host_hostname')
+
+# Properties not written to config.json by properties_writer=config. iocage set has side effects
+# for them, for example it moves the dataset of a template or sets the ZFS properties.
+OFFLINE_UNSAFE_PROPERTIES = ('template', 'host_hostuuid', 'release', 'basejail', 'type', 'jail_zfs',
+                             'jail_zfs_dataset', 'resolver', 'available', 'compression', 'compressratio',
+                             'dedup', 'mountpoint', 'origin', 'quota', 'reservation', 'used')
+
+# Properties applied by iocage restart -s
+SOFT_RESTART_PROPERTIES = ('host_hostname',)
+
+# Number of the snapshots of the facts kept for facts_since
+FACTS_SNAPSHOTS = 16
+
+# Operations and their keys evaluated by the state plan
+PLAN_OPERATIONS = ('create', 'clone', 'set', 'start', 'stop', 'restart', 'absent', 'fetch')
+PLAN_KEYS = ('op', 'name', 'properties', 'clone_from', 'release', 'components', 'pkglist', 'args')
+
+# Results shared by the functions during one run of the module
+_run_cache = {}
+_run_lock = Lock()
+
+# Facts needed by the states
+GATHER_STATE = dict(
+    absent=('jails', 'templates'),
+    basejail=('jails', 'templates', 'releases'),
+    cloned=('jails', 'templates'),
+    exec=('jails', 'templates'),
+    facts=(),
+    fetched=('plugins', 'releases'),
+    get=('jails', 'templates'),
+    pkg=('jails', 'templates'),
+    plan=('jails', 'templates', 'releases'),
+    present=('jails', 'templates', 'releases'),
+    progress=(),
+    restarted=('jails', 'templates'),
+    set=('jails', 'templates'),
+    started=('jails', 'templates'),
+    stopped=('jails', 'templates'),
+    template=('jails', 'templates', 'releases'),
+    thickjail=('jails', 'templates', 'releases'),
+)
+
+
+def _all_jails_started(facts, boot=False):
+    '''Test all jail started. Test only jails with boot=on if boot is True.'''
+    states = set([facts['iocage_jails'][jail]['state'] for jail in facts['iocage_jails'].keys()
+                  if not boot or facts['iocage_jails'][jail]['boot'] == 'on'])
+    if boot and len(states) == 0:
+        return True
     return len(states) == 1 and next(iter(states)) == 'up'
 
 
-def _all_jails_stopped(facts):
-    '''Test all jail stopped.'''
-    states = set([facts['iocage_jails'][jail]['state'] for jail in facts['iocage_jails'].keys()])
+def _all_jails_stopped(facts, boot=False):
+    '''Test all jail stopped. Test only jails with boot=on if boot is True.'''
+    states = set([facts['iocage_jails'][jail]['state'] for jail in facts['iocage_jails'].keys()
+                  if not boot or facts['iocage_jails'][jail]['boot'] == 'on'])
+    if boot and len(states) == 0:
+        return True
     return len(states) == 1 and next(iter(states)) == 'down'
 
 
@@ -413,13 +1055,519 @@ def _props_to_str(props):
     return argstr
 
 
+PROGRESS_PHASES = (
+    ('download', re.compile(r'^\s*(Fetching|Downloading|Looking up)', re.IGNORECASE)),
+    ('verify', re.compile(r'^\s*(Verifying|Inspecting|Preparing)', re.IGNORECASE)),
+    ('extract', re.compile(r'^\s*Extracting', re.IGNORECASE)),
+    ('install', re.compile(r'^\s*Installing', re.IGNORECASE)),
+)
+PROGRESS_PERCENT = re.compile(r'(\d{1,3})%')
+
+
+def _progress_parse(line, phase=None):
+    '''Parse the phase and the percentage of the output line. Return phase, percent.'''
+
+    for _phase, _regex in PROGRESS_PHASES:
+        if _regex.match(line):
+            phase = _phase
+            break
+    _percent = PROGRESS_PERCENT.search(line)
+
+    return phase, int(_percent.group(1)) if _percent else None
+
+
+def _output_mode(output):
+    '''Parse the option output. Return mode and its argument. Return (None, None) if not valid.'''
+
+    if output in ('full', 'summary'):
+        return output, None
+    if output.startswith('tail:') and output[5:].isdigit() and int(output[5:]) > 0:
+        return 'tail', int(output[5:])
+    if output.startswith('file:') and len(output) > 5:
+        return 'file', output[5:]
+
+    return None, None
+
+
+def _output_sink(module, output='full'):
+    '''Return the functions write(stream, data) and close() of the output sink. Keep all output
+       (full), the last N lines (tail:N), nothing (summary), or write the output to a file
+       (file:path). A last line without newline is counted as a line in all modes. close() returns
+       stdout, stderr, and the summary of the output.'''
+
+    mode, arg = _output_mode(output)
+    summary = dict(mode=mode, stdout_lines=0, stdout_bytes=0, stderr_lines=0, stderr_bytes=0)
+    chunks = dict(stdout=[], stderr=[])
+    partial = dict(stdout=b'', stderr=b'')
+    tails = dict(stdout=deque(maxlen=arg), stderr=deque(maxlen=arg)) if mode == 'tail' else None
+    try:
+        f = open(arg, 'wb') if mode == 'file' else None
+    except OSError as e:
+        module.fail_json(msg=f"Unable to write the output to {arg}: {e}")
+
+    def write(stream, data):
+        summary[f"{stream}_bytes"] += len(data)
+        summary[f"{stream}_lines"] += data.count(b'\n')
+        # keep the newlines. The tail is the exact end of the output
+        _lines = (partial[stream] + data).split(b'\n')
+        partial[stream] = _lines.pop()
+        if mode == 'full':
+            chunks[stream].append(data)
+        elif mode == 'tail':
+            tails[stream].extend(_line + b'\n' for _line in _lines)
+        elif mode == 'file':
+            f.write(data)
+
+    def close():
+        if mode == 'file':
+            f.close()
+            summary['file'] = arg
+        for _stream in ('stdout', 'stderr'):
+            if partial[_stream]:
+                summary[f"{_stream}_lines"] += 1
+                if mode == 'tail':
+                    tails[_stream].append(partial[_stream])
+            if mode == 'tail':
+                chunks[_stream] = list(tails[_stream])
+        if mode == 'tail':
+            summary['truncated'] = max(summary['stdout_lines'], summary['stderr_lines']) > arg
+        return (to_text(b''.join(chunks['stdout']), errors='surrogate_or_strict'),
+                to_text(b''.join(chunks['stderr']), errors='surrogate_or_strict'),
+                summary)
+
+    return write, close
+
+
+def _run_command_stream(module, cmd, progress_file=None, output='full'):
+    '''Run the command cmd. Read stdout and stderr incrementally into the sink of the output. See
+       _output_sink. Append the lines with the parsed progress to progress_file if defined. Keep
+       the summary of the output in the run cache. Return rc, stdout, stderr.'''
+
+    _start = time.time()
+    partial = dict(stdout=b'', stderr=b'')
+    state = dict(phase=None, percent=None)
+    write, close = _output_sink(module, output)
+    try:
+        f = open(progress_file, 'w') if progress_file else None
+    except OSError as e:
+        module.fail_json(msg=f"Unable to write progress_file {progress_file}: {e}")
+
+    def _write(record):
+        if f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+
+    def _lines(stream, data):
+        for _line in re.split(rb'[\r\n]', data):
+            _text = to_text(_line, errors='surrogate_or_strict').rstrip()
+            if not _text:
+                continue
+            _phase, _percent = _progress_parse(_text, state['phase'])
+            if _phase != state['phase']:
+                state['phase'], state['percent'] = _phase, None
+            if _percent is not None:
+                state['percent'] = _percent
+            _write(dict(time=round(time.time() - _start, 3), stream=stream, line=_text,
+                        phase=state['phase'], percent=state['percent']))
+
+    try:
+        _write(dict(time=0, cmd=cmd, phase=None, percent=None))
+        try:
+            proc = subprocess.Popen(shlex.split(cmd), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+        except OSError as e:
+            _write(dict(time=round(time.time() - _start, 3), done=True, rc=127))
+            close()
+            module.fail_json(msg=f"Command '{cmd}' not executed: {e}")
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(proc.stdout, selectors.EVENT_READ, 'stdout')
+            selector.register(proc.stderr, selectors.EVENT_READ, 'stderr')
+            while selector.get_map():
+                for key, _events in selector.select():
+                    stream = key.data
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        if f:
+                            _lines(stream, partial[stream])
+                        continue
+                    write(stream, chunk)
+                    if f:
+                        data = partial[stream] + chunk
+                        _end = max(data.rfind(b'\n'), data.rfind(b'\r')) + 1
+                        _lines(stream, data[:_end])
+                        partial[stream] = data[_end:]
+        rc = proc.wait()
+        _write(dict(time=round(time.time() - _start, 3), done=True, rc=rc, phase=state['phase'],
+                    percent=state['percent']))
+    finally:
+        if f:
+            f.close()
+
+    out, err, summary = close()
+    summary['rc'] = rc
+    _run_cache['output'] = summary
+
+    return rc, out, err
+
+
+def progress_read(module, progress_file):
+    '''Read the progress of the command written to progress_file. Return dictionary.'''
+
+    progress = dict(cmd=None, phase=None, percent=None, line=None, lines=0, elapsed=0, done=False, rc=None)
+    if not os.path.isfile(progress_file):
+        return progress
+
+    with open(progress_file) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            progress['elapsed'] = record.get('time', progress['elapsed'])
+            progress['phase'] = record.get('phase', progress['phase'])
+            progress['percent'] = record.get('percent', progress['percent'])
+            if 'cmd' in record:
+                progress['cmd'] = record['cmd']
+            if 'line' in record:
+                progress['line'] = record['line']
+                progress['lines'] += 1
+            if record.get('done'):
+                progress['done'] = True
+                progress['rc'] = record.get('rc')
+
+    return progress
+
+
+def _timings_phase(phase):
+    '''Switch the timings to the phase. Return the previous phase.'''
+
+    timings = _run_cache.get('timings')
+    if timings is None:
+        return None
+
+    _now = time.monotonic()
+    previous = timings['phase']
+    if previous is not None:
+        timings['phases'][previous] = timings['phases'].get(previous, 0) + _now - timings['start']
+    timings['phase'], timings['start'] = phase, _now
+
+    return previous
+
+
+def _timings_record(cmd, rc, elapsed):
+    '''Record the duration of the command cmd in the timings.'''
+
+    timings = _run_cache.get('timings')
+    if timings is None:
+        return
+
+    _words = cmd.split()
+    _key = os.path.basename(_words[0])
+    if len(_words) > 1 and not _words[1].startswith('-'):
+        _key += f" {_words[1]}"
+    with _run_lock:
+        timings['commands'].append(dict(cmd=cmd, phase=timings['phase'], elapsed=round(elapsed, 3), rc=rc))
+        timings['counts'][_key] = timings['counts'].get(_key, 0) + 1
+
+
+def _timings_result():
+    '''Close the current phase of the timings. Return dictionary.'''
+
+    timings = _run_cache.get('timings')
+    if timings is None:
+        return None
+
+    _timings_phase(timings['phase'])
+    phases = dict((_phase, round(_elapsed, 3)) for _phase, _elapsed in timings['phases'].items())
+    phases['total'] = round(sum(timings['phases'].values()), 3)
+
+    return dict(phases=phases, commands=timings['commands'], counts=timings['counts'])
+
+
+def _profile_dump(profiler, path):
+    '''Stop the profiler and write the statistics to path.'''
+
+    profiler.disable()
+    profiler.dump_stats(path)
+
+
+def _run_command(module, cmd, cache=False, progress_file=None, output='full'):
+    '''Run the command cmd. If cache is True return the result of the same command if it already
+       ran and the cache was not cleared. A command with cache=False may change the jails and clears
+       the cache. Stream the output to progress_file if defined and to the sink of the output if
+       not full. Return rc, stdout, stderr.'''
+
+    _commands = _run_cache.setdefault('commands', {})
+    _stats = _run_cache.setdefault('command_stats', dict(hits=0, misses=0))
+    with _run_lock:
+        if cache and cmd in _commands:
+            _stats['hits'] += 1
+            return _commands[cmd]
+        if cache:
+            _stats['misses'] += 1
+        else:
+            _commands.clear()
+
+    _start = time.monotonic()
+    if progress_file or output != 'full':
+        rc, out, err = _run_command_stream(module, cmd, progress_file, output)
+    else:
+        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
+                                          errors='surrogate_or_strict')
+    _timings_record(cmd, rc, time.monotonic() - _start)
+    if cache:
+        with _run_lock:
+            _commands[cmd] = (rc, out, err)
+
+    return rc, out, err
+
+
+def _map_parallel(workers, func, items):
+    '''Apply func to items. Run up to workers calls concurrently. Return list of the results in the
+       order of items.'''
+
+    workers = min(workers, len(items))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, items))
+
+    return [func(item) for item in items]
+
+
+def _gather_artifacts(gather, state, bupdate=False, facts_format='full', facts_properties=None):
+    '''Return set of the facts to be gathered.'''
+
+    if 'all' in gather and facts_format != 'none':
+        artifacts = set(GATHER_ALL)
+    else:
+        artifacts = set(GATHER_STATE[state])
+    if bupdate:
+        artifacts.add('releases')
+    if facts_format != 'none':
+        artifacts.update(set(gather) - set(['all', 'minimal']))
+    if facts_format != 'full' and not facts_properties:
+        artifacts.discard('properties')
+
+    return artifacts
+
+
+def _facts_format(facts, facts_format='full'):
+    '''Return the facts in the format facts_format.'''
+
+    if facts_format == 'full':
+        return facts
+    if facts_format == 'none':
+        return dict((_key, facts[_key]) for _key in ('iocage_states', 'iocage_properties') if _key in facts)
+
+    _facts = dict(facts)
+    for _artifact in ('jails', 'templates', 'plugins'):
+        _items = facts.get(f"iocage_{_artifact}")
+        if _items:
+            _facts[f"iocage_{_artifact}"] = dict(
+                (_name, dict((_key, _value) for _key, _value in _item.items()
+                             if _key != 'name' and _value not in ('-', '', 'None')))
+                for _name, _item in _items.items())
+
+    return _facts
+
+
+def _facts_cache_fingerprint(module):
+    '''Return modification times of the iocage root, its directories, and of config.json of all jails
+       and templates. Return None if the iocage root is not known.'''
+
+    iocroot = _iocage_root(module)
+    if not iocroot:
+        return None
+
+    _paths = [iocroot] + [os.path.join(iocroot, _item) for _item in ('jails', 'templates', 'releases', 'defaults.json')]
+    for _dir in ('jails', 'templates'):
+        try:
+            _paths += [os.path.join(iocroot, _dir, _name, 'config.json')
+                       for _name in sorted(os.listdir(os.path.join(iocroot, _dir)))]
+        except OSError:
+            pass
+
+    fingerprint = {}
+    for _path in _paths:
+        try:
+            fingerprint[_path] = os.stat(_path).st_mtime_ns
+        except OSError:
+            pass
+
+    return fingerprint
+
+
+def _facts_digest(data):
+    '''Return the SHA-256 hash of the JSON serialized data.'''
+
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def _facts_snapshot_path(module, fingerprint):
+    return os.path.join(module.params['facts_cache_dir'], 'snapshots', f"{fingerprint}.json")
+
+
+def _facts_snapshot_write(module, fingerprint, snapshot):
+    '''Write the snapshot of the fingerprint. Keep the last FACTS_SNAPSHOTS snapshots. Errors are
+       ignored.'''
+
+    _dir = os.path.dirname(_facts_snapshot_path(module, fingerprint))
+    _tmp = None
+    try:
+        os.makedirs(_dir, mode=0o700, exist_ok=True)
+        _fd, _tmp = tempfile.mkstemp(dir=_dir, prefix=f".{fingerprint}.")
+        with os.fdopen(_fd, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(_tmp, _facts_snapshot_path(module, fingerprint))
+        _snapshots = [os.path.join(_dir, _file) for _file in os.listdir(_dir) if _file.endswith('.json')]
+        for _path in sorted(_snapshots, key=os.path.getmtime)[:-FACTS_SNAPSHOTS]:
+            os.remove(_path)
+    except OSError:
+        if _tmp and os.path.exists(_tmp):
+            os.remove(_tmp)
+
+
+def _facts_delta(module, facts, since):
+    '''Compare the facts with the snapshot of the fingerprint since. Return the facts without the
+       sections found in the snapshot and the delta. Return all facts if the snapshot is not found
+       or if a section is not in the snapshot.'''
+
+    snapshot = {}
+    for _section in ('jails', 'templates', 'plugins', 'releases'):
+        _items = facts.get(f"iocage_{_section}")
+        if _items is None:
+            continue
+        if _section == 'releases':
+            snapshot[_section] = dict((_release, _release) for _release in _items)
+        else:
+            snapshot[_section] = dict((_name, _facts_digest(_item)) for _name, _item in _items.items())
+
+    _previous = None
+    if since and re.match(r'^[0-9a-f]{32}$', since):
+        _previous = _read_json(_facts_snapshot_path(module, since))
+    if not isinstance(_previous, dict):
+        _previous = {}
+    # a section not in the snapshot is returned in full with all other sections
+    delta = dict(full=not _previous or not set(snapshot) <= set(_previous))
+    _facts = dict(facts)
+
+    for _section in snapshot:
+        if delta['full']:
+            break
+        del _facts[f"iocage_{_section}"]
+        _old = _previous[_section]
+        _new = snapshot[_section]
+        _changed = [_name for _name in _new if _old.get(_name) != _new[_name]]
+        _removed = [_name for _name in _old if _name not in _new]
+        if not _changed and not _removed:
+            continue
+        if _section == 'releases':
+            delta[_section] = dict(added=_changed, removed=_removed)
+        else:
+            _items = facts[f"iocage_{_section}"]
+            delta[_section] = dict(changed=dict((_name, _items[_name]) for _name in _changed), removed=_removed)
+
+    _previous.update(snapshot)
+    fingerprint = _facts_digest(_previous)
+    _facts_snapshot_write(module, fingerprint, _previous)
+    delta.update(fingerprint=fingerprint, since=since)
+
+    return _facts, delta
+
+
+def _facts_cache_path(module, key):
+    return os.path.join(module.params['facts_cache_dir'], f"{key}.json")
+
+
+def _facts_cache_read(module, key, fingerprint):
+    '''Return cached data of the key or None if not cached, expired, or the fingerprint changed.'''
+
+    if not module.params.get('facts_cache'):
+        return None
+
+    entry = _read_json(_facts_cache_path(module, key))
+    if not isinstance(entry, dict):
+        return None
+    if time.time() - entry.get('time', 0) > module.params['facts_cache_ttl']:
+        return None
+    if entry.get('fingerprint') != fingerprint:
+        return None
+
+    return entry.get('data')
+
+
+def _facts_cache_write(module, key, fingerprint, data):
+    '''Write data of the key to the cache. Errors are ignored.'''
+
+    if not module.params.get('facts_cache'):
+        return
+
+    _dir = module.params['facts_cache_dir']
+    _tmp = None
+    try:
+        os.makedirs(_dir, mode=0o700, exist_ok=True)
+        _fd, _tmp = tempfile.mkstemp(dir=_dir, prefix=f".{key}.")
+        with os.fdopen(_fd, 'w') as f:
+            json.dump(dict(time=time.time(), fingerprint=fingerprint, data=data), f)
+        os.replace(_tmp, _facts_cache_path(module, key))
+    except OSError:
+        if _tmp and os.path.exists(_tmp):
+            os.remove(_tmp)
+
+
+def _facts_cache_invalidate(module, *artifacts):
+    '''Remove the cached facts artifacts.'''
+
+    if not module.params.get('facts_cache'):
+        return
+
+    try:
+        _files = os.listdir(module.params['facts_cache_dir'])
+    except OSError:
+        return
+    for _artifact in artifacts:
+        for _file in _files:
+            if _file in (f"{_artifact}.json", f"{_artifact}-properties.json") or \
+               _file.startswith(f"{_artifact}-properties-"):
+                try:
+                    os.remove(os.path.join(module.params['facts_cache_dir'], _file))
+                except OSError:
+                    pass
+
+
+def _host_release(module):
+    '''Return release of the remote host. Use the cache if enabled.'''
+
+    try:
+        fingerprint = dict(boot=os.stat('/var/run/dmesg.boot').st_mtime_ns)
+    except OSError:
+        fingerprint = None
+    release = _facts_cache_read(module, 'release', fingerprint)
+    if release:
+        return release
+
+    rc, out, err = _run_command(module, "uname -r", cache=True)
+    if rc != 0:
+        module.fail_json(msg="Unable to run uname -r ???")
+    matches = re.match(r'(\d+\.\d+)\-(RELEASE|RC\d+).*', out.strip())
+    if matches:
+        release = matches.group(1) + '-RELEASE'
+    else:
+        module.fail_json(msg=f"Release not recognised: {out}")
+    _facts_cache_write(module, 'release', fingerprint, release)
+
+    return release
+
+
 def _command_fail(module, label, cmd, rc, stdout, stderr):
     '''Command fail. Create message and terminate module.'''
     module.fail_json(msg=f"{label}\ncmd: '{cmd}' return: {rc}\nstdout: '{stdout}'\nstderr: '{stderr}'")
 
 
-def _get_iocage_facts(module, iocage_path, artifact='all', name=None):
-    '''Collect facts.'''
+def _get_iocage_facts(module, iocage_path, artifact='all', name=None, gather=None):
+    '''Collect facts. Gather all facts if gather is None.'''
 
     opt = dict(jails="list -hl",
                plugins="list -hP",
@@ -427,24 +1575,41 @@ def _get_iocage_facts(module, iocage_path, artifact='all', name=None):
                releases="list -hr",
                init="list -h")
 
+    if gather is None:
+        gather = GATHER_ALL
+
     if artifact == 'all':
         # _init = _get_iocage_facts(module, iocage_path, "init")
-        _jails = _get_iocage_facts(module, iocage_path, 'jails')
-        _plugins = _get_iocage_facts(module, iocage_path, 'plugins')
-        _templates = _get_iocage_facts(module, iocage_path, 'templates')
-        _releases = _get_iocage_facts(module, iocage_path, 'releases')
-        return dict(iocage_jails=_jails,
-                    iocage_plugins=_plugins,
-                    iocage_templates=_templates,
-                    iocage_releases=_releases)
+        facts = {}
+        for _artifact in ('jails', 'plugins', 'templates', 'releases'):
+            if _artifact in gather:
+                facts[f"iocage_{_artifact}"] = _get_iocage_facts(module, iocage_path, _artifact, gather=gather)
+        return facts
 
     if artifact in opt:
         cmd = f"{iocage_path} {opt[artifact]}"
     else:
         module.fail_json(msg=f"_get_iocage_facts(artifact={artifact}): argument not understood.")
 
-    rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                      errors='surrogate_or_strict')
+    if artifact != 'init' and module.params.get('facts_cache'):
+        _cache_key = artifact
+        if artifact in ('jails', 'templates') and 'properties' in gather:
+            _cache_key += '-properties'
+            if module.params.get('facts_properties'):
+                _keys = ','.join(sorted(module.params['facts_properties']))
+                _cache_key += '-' + hashlib.sha256(_keys.encode()).hexdigest()[:12]
+        _fingerprint = _facts_cache_fingerprint(module)
+        _items = _facts_cache_read(module, _cache_key, _fingerprint)
+        if _items is not None and artifact in ('jails', 'plugins'):
+            _items = _facts_cache_run_state(module, iocage_path, _items)
+        if _items is not None:
+            if name and artifact != 'releases':
+                return _items.get(name, {})
+            return _items
+    else:
+        _cache_key = None
+
+    rc, out, err = _run_command(module, cmd, cache=True)
     if rc != 0 and artifact != 'init':
         _command_fail(module, "Function _get_iocage_facts failed.", cmd, rc, out, err)
     elif artifact == 'init':
@@ -452,6 +1617,8 @@ def _get_iocage_facts(module, iocage_path, artifact='all', name=None):
 
     if artifact == 'releases':
         releases = [line.strip() for line in out.splitlines()]
+        if _cache_key:
+            _facts_cache_write(module, _cache_key, _fingerprint, releases)
         return releases
 
     elif artifact in ('jails', 'templates', 'plugins'):
@@ -473,8 +1640,6 @@ def _get_iocage_facts(module, iocage_path, artifact='all', name=None):
                             _keys = ('jid', 'name', 'boot', 'state', 'type', 'release', 'ip4', 'ip6', 'template')
                         if _name:
                             _items[_name] = dict(zip(_keys, _fragments))
-                            _properties = _jail_get_properties(module, iocage_path, _name)
-                            _items[_name]['properties'] = _properties
                     elif artifact == 'plugins':
                         (_jid, _name, _boot, _state, _type, _release, _ip4, _ip6, _template, _portal, _doc_url) = _fragments
                         _keys = ('jid', 'name', 'boot', 'state', 'type', 'release', 'ip4', 'ip6', 'template', 'portal', 'doc_url')
@@ -484,6 +1649,15 @@ def _get_iocage_facts(module, iocage_path, artifact='all', name=None):
         except ValueError:
             module.fail_json(msg=f"unable to parse {out}")
 
+        if artifact in ('jails', 'templates') and 'properties' in gather:
+            _properties = _jails_get_properties(module, iocage_path, list(_items.keys()),
+                                                module.params.get('facts_properties'))
+            for _name in _items:
+                _items[_name]['properties'] = _properties[_name]
+
+        if _cache_key:
+            _facts_cache_write(module, _cache_key, _fingerprint, _items)
+
         if name:
             if name in _items:
                 return _items[name]
@@ -492,35 +1666,302 @@ def _get_iocage_facts(module, iocage_path, artifact='all', name=None):
         return _items
 
 
-def _jail_get_properties(module, iocage_path, name):
+def _facts_refresh(module, iocage_path, facts, artifact, name=None, gather=None):
+    '''Refresh the facts artifact (jails or templates) after a change of the jail name. List the
+       artifact and collect the properties only of the jail name and of the jails not in facts.
+       Keep the properties of the other jails. Return dictionary.'''
+
+    if gather is None:
+        gather = GATHER_ALL
+
+    _phase = _timings_phase('verify')
+    _items = _get_iocage_facts(module, iocage_path, artifact, gather=set(gather) - set(['properties']))
+    if 'properties' in gather:
+        _facts = facts.get(f"iocage_{artifact}", {})
+        _names = [_name for _name in _items
+                  if _name == name or _name not in _facts or 'properties' not in _facts[_name]]
+        _properties = _jails_get_properties(module, iocage_path, _names, module.params.get('facts_properties'))
+        for _name in _items:
+            if _name in _properties:
+                _items[_name]['properties'] = _properties[_name]
+            else:
+                _items[_name]['properties'] = _facts[_name]['properties']
+    _timings_phase(_phase)
 
-    if name:
-        properties = {}
-        cmd = f"{iocage_path} get --all {name}"
-        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                          errors='surrogate_or_strict')
+    return _items
+
+
+def _jail_parse_properties(module, out, keys=None):
+    '''Parse the output of iocage get --all. Parse only the properties keys if defined. Return
+       dictionary.'''
+
+    properties = {}
+    _properties = [line.strip() for line in out.strip().split('\n')]
+    for p in _properties:
+        for _property in [p.split(':', 1)]:
+            if len(_property) == 2:
+                if keys is None or _property[0] in keys:
+                    properties[_property[0]] = _property[1]
+            else:
+                module.fail_json(msg=f"error parsing property {p} from {properties}")
+
+    return properties
+
+
+def _iocage_root(module):
+    '''Return the mountpoint of the active iocage dataset or None if not found.'''
+
+    if 'iocroot' in _run_cache:
+        return _run_cache['iocroot']
+
+    iocroot = module.params.get('iocroot')
+    zfs_path = module.get_bin_path('zfs')
+    if not iocroot and zfs_path:
+        cmd = f"{zfs_path} get -H -o name,value org.freebsd.ioc:active"
+        rc, out, err = _run_command(module, cmd, cache=True)
+        pool = None
         if rc == 0:
-            _properties = [line.strip() for line in out.strip().split('\n')]
-            for p in _properties:
-                for _property in [p.split(':', 1)]:
-                    if len(_property) == 2:
-                        properties[_property[0]] = _property[1]
-                    else:
-                        module.fail_json(msg=f"error parsing property {p} from {properties}")
+            for line in out.splitlines():
+                _fragments = line.split('\t')
+                if len(_fragments) == 2 and _fragments[1] == 'yes' and '/' not in _fragments[0]:
+                    pool = _fragments[0]
+                    break
+        if pool:
+            cmd = f"{zfs_path} get -H -o value mountpoint {pool}/iocage"
+            rc, out, err = _run_command(module, cmd, cache=True)
+            if rc == 0:
+                iocroot = out.strip()
+
+    if not iocroot or not os.path.isdir(iocroot):
+        iocroot = None
+    _run_cache['iocroot'] = iocroot
+
+    return iocroot
+
+
+def _read_json(path):
+    '''Return the content of the JSON file path or None if the file can not be read.'''
+
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _jail_config_path(iocroot, name):
+    '''Return path to config.json of the jail or template name or None if not found.'''
+
+    for _dir in ('jails', 'templates'):
+        _path = os.path.join(iocroot, _dir, name, 'config.json')
+        if os.path.isfile(_path):
+            return _path
+
+    return None
+
+
+def _iocage_defaults(iocroot):
+    '''Return the content of defaults.json in the iocage root.'''
+
+    if 'defaults' not in _run_cache:
+        _defaults = _read_json(os.path.join(iocroot, 'defaults.json'))
+        _run_cache['defaults'] = _defaults if isinstance(_defaults, dict) else {}
+
+    return _run_cache['defaults']
+
+
+def _jail_read_properties(iocroot, name, keys=None):
+    '''Read properties of the jail name from config.json and merge them with defaults.json. Keep
+       only the properties keys if defined. Return the same dictionary as _jail_parse_properties or
+       None if config.json can not be read.'''
+
+    _path = _jail_config_path(iocroot, name)
+    if _path is None:
+        return None
+    _config = _read_json(_path)
+    if not isinstance(_config, dict):
+        return None
+
+    _properties = dict(_iocage_defaults(iocroot))
+    _properties.update(_config)
+
+    return dict((k, str(_properties[k])) for k in sorted(_properties) if keys is None or k in keys)
+
+
+def _jail_offline_split(module, properties, existing):
+    '''Split the properties of a stopped jail into the ones that can be written to config.json and
+       the ones set by iocage. Return the two dictionaries.'''
+
+    if module.params.get('properties_writer') != 'config' or not _iocage_root(module):
+        return {}, dict(properties)
+
+    offline = dict((k, v) for k, v in properties.items() if k in existing and k not in OFFLINE_UNSAFE_PROPERTIES)
+
+    return offline, dict((k, v) for k, v in properties.items() if k not in offline)
+
+
+def _jail_config_write(module, name, properties):
+    '''Write the properties of the stopped jail or template name to config.json. Keep the previous
+       file in config.json.bak. Return True if written.'''
+
+    iocroot = _iocage_root(module)
+    _path = _jail_config_path(iocroot, name) if iocroot else None
+    _config = _read_json(_path) if _path else None
+    if not isinstance(_config, dict):
+        return False
+
+    _defaults = _iocage_defaults(iocroot)
+    config = dict(_config)
+    for _key, _value in properties.items():
+        _old = _config.get(_key, _defaults.get(_key))
+        if isinstance(_old, int) and re.match(r'^-?\d+$', str(_value)):
+            config[_key] = int(_value)
+        elif isinstance(_value, int):
+            config[_key] = _value
         else:
-            _command_fail(module, f"_jail_get_properties({name})", cmd, rc, out, err)
-    else:
+            config[_key] = f"{_value}"
+
+    _tmp = None
+    try:
+        shutil.copy2(_path, f"{_path}.bak")
+        _fd, _tmp = tempfile.mkstemp(dir=os.path.dirname(_path), prefix='.config.json.')
+        with os.fdopen(_fd, 'w') as f:
+            json.dump(config, f, indent=4, sort_keys=True)
+        os.chmod(_tmp, os.stat(_path).st_mode & 0o7777)
+        os.replace(_tmp, _path)
+    except OSError:
+        if _tmp and os.path.exists(_tmp):
+            os.remove(_tmp)
+        return False
+
+    # The cached output of iocage get is not valid any more
+    with _run_lock:
+        _run_cache.get('commands', {}).clear()
+
+    return True
+
+
+def _jails_get_properties(module, iocage_path, names, keys=None):
+    '''Collect properties of the jails names. Read config.json if properties_backend=config. Run up
+       to facts_workers commands concurrently otherwise. Keep only the properties keys if defined.
+       Return dictionary name: properties in the order of names.'''
+
+    def _run(cmd):
+        return _run_command(module, cmd, cache=True)
+
+    properties = {}
+    if module.params.get('properties_backend') == 'config' and names:
+        iocroot = _iocage_root(module)
+        if iocroot:
+            for _name in names:
+                _properties = _jail_read_properties(iocroot, _name, keys)
+                if _properties is not None:
+                    properties[_name] = _properties
+
+    cli_names = [_name for _name in names if _name not in properties]
+    cmds = [f"{iocage_path} get --all {_name}" for _name in cli_names]
+    results = _map_parallel(module.params.get('facts_workers') or 1, _run, cmds)
+
+    for _name, cmd, (rc, out, err) in zip(cli_names, cmds, results):
+        if rc != 0:
+            _command_fail(module, f"_jail_get_properties({_name})", cmd, rc, out, err)
+        properties[_name] = _jail_parse_properties(module, out, keys)
+
+    return dict((_name, properties[_name]) for _name in names)
+
+
+def _jail_get_properties(module, iocage_path, name):
+
+    if not name:
         module.fail_json(msg=f"_jail_get_properties:\njail {name} not found.")
 
-    return properties
+    return _jails_get_properties(module, iocage_path, [name])[name]
+
+
+def _jail_jls_name(name):
+    '''Return the name of the iocage jail name in jls(8).'''
+
+    return f"ioc-{name.replace('.', '_')}"
+
+
+def _jails_probe(module):
+    '''List the running jails by jls(8). Return dictionary {jls name: JID} or None if jls is
+       not available.'''
+
+    jls_path = module.get_bin_path('jls')
+    if not jls_path:
+        return None
+
+    cmd = f"{jls_path} --libxo json jid name"
+    rc, out, err = _run_command(module, cmd, cache=True)
+    if rc != 0:
+        return None
+
+    try:
+        # jls omits the list if no jail is running
+        _jails = json.loads(out)['jail-information'].get('jail', [])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if not isinstance(_jails, list):
+        return None
+
+    return dict((str(_jail['name']), str(_jail['jid'])) for _jail in _jails
+                if isinstance(_jail, dict) and 'name' in _jail and 'jid' in _jail)
+
+
+def _jails_state_refresh(module, iocage_path, facts, name=None, gather=None):
+    '''Update the state and the JID of the jails in facts after start, stop, or restart. Probe
+       the running jails by jls(8). Refresh the facts of jails if jls is not available. Return
+       dictionary.'''
+
+    _phase = _timings_phase('verify')
+    probe = _jails_probe(module)
+    _timings_phase(_phase)
+    if probe is None:
+        return _facts_refresh(module, iocage_path, facts, 'jails', name, gather)
+
+    for _name, _jail in facts['iocage_jails'].items():
+        jid = probe.get(_jail_jls_name(_name))
+        _jail['state'] = 'up' if jid else 'down'
+        _jail['jid'] = jid if jid else '-'
+
+    return facts['iocage_jails']
+
+
+def _facts_cache_run_state(module, iocage_path, items):
+    '''Update the state and the JID of the cached jails or plugins items. A jail can be started or
+       stopped without a change of the fingerprint of the cache. Probe the running jails by jls(8)
+       or by iocage list -h. Return items or None if the state is not known.'''
+
+    probe = _jails_probe(module)
+    if probe is None:
+        cmd = f"{iocage_path} list -h"
+        rc, out, err = _run_command(module, cmd, cache=True)
+        if rc != 0:
+            return None
+        probe = {}
+        for line in out.splitlines():
+            _fragments = line.split('\t')
+            if len(_fragments) > 2 and _fragments[2] == 'up':
+                probe[_jail_jls_name(_fragments[1])] = _fragments[0]
+
+    for _name, _item in items.items():
+        jid = probe.get(_jail_jls_name(_name))
+        _item['state'] = 'up' if jid else 'down'
+        _item['jid'] = jid if jid else '-'
+
+    return items
 
 
 def jail_started(module, iocage_path, name):
     '''Test jail name is started(up) or not(down). Return Boolean.'''
 
+    probe = _jails_probe(module)
+    if probe is not None:
+        return _jail_jls_name(name) in probe
+
     cmd = f"{iocage_path} list -h"
-    rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                      errors='surrogate_or_strict')
+    rc, out, err = _run_command(module, cmd, cache=True)
     if rc != 0:
         _command_fail(module, f"jail_started({name})", cmd, rc, out, err)
 
@@ -544,8 +1985,7 @@ def jail_exists(module, iocage_path, name):
     '''Test jail name exists. Return Boolean.'''
 
     cmd = f"{iocage_path} get host_hostuuid {name}"
-    rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                      errors='surrogate_or_strict')
+    rc, out, err = _run_command(module, cmd, cache=True)
 
     if rc == 0:
         st = True
@@ -554,7 +1994,21 @@ def jail_exists(module, iocage_path, name):
     else:
         _command_fail(module, f"jail_exists({name})", cmd, rc, out, err)
 
-    return st
+    return st
+
+
+def _jail_cmd(iocage_path, command, name, args=""):
+    '''Return the iocage command (start, stop, restart, destroy) of the jail name.'''
+
+    cmd = f"{iocage_path} {command}"
+    if command == 'destroy':
+        cmd += " --force"
+    if args:
+        cmd += f" {args}"
+    if name:
+        cmd += f" {name}"
+
+    return cmd
 
 
 def jail_start(module, iocage_path, name, args=""):
@@ -571,14 +2025,11 @@ def jail_start(module, iocage_path, name, args=""):
     '''
 
     _changed = True
-    cmd = f"{iocage_path} start"
-    if args:
-        cmd += f" {args}"
-    cmd += f" {name}"
+    cmd = _jail_cmd(iocage_path, 'start', name, args)
 
     if not module.check_mode:
-        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                          errors='surrogate_or_strict')
+        rc, out, err = _run_command(module, cmd)
+        _facts_cache_invalidate(module, 'jails', 'plugins')
         if rc != 0:
             _command_fail(module, "Jail(s) not started.", cmd, rc, out, err)
         if name:
@@ -618,17 +2069,15 @@ def jail_stop(module, iocage_path, name, args=""):
     '''
 
     _changed = True
-    cmd = f"{iocage_path} stop"
-    if args:
-        cmd += f" {args}"
-    cmd += f" {name}"
+    cmd = _jail_cmd(iocage_path, 'stop', name, args)
 
     if not module.check_mode:
-        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                          errors='surrogate_or_strict')
+        rc, out, err = _run_command(module, cmd)
+        _facts_cache_invalidate(module, 'jails', 'plugins')
         if rc != 0:
             _command_fail(module, "Jail(s) not stopped.", cmd, rc, out, err)
         if name:
+            _pending_clear(module, None if name == 'ALL' else [name])
             if name == 'ALL':
                 _msg = f"All jails stopped.\n{cmd}\n{out}"
             else:
@@ -649,6 +2098,74 @@ def jail_stop(module, iocage_path, name, args=""):
     return _changed, _msg, out, err
 
 
+def _pending_path(module, name):
+    return os.path.join(module.params['pending_dir'], f"{name}.json")
+
+
+def pending_read(module):
+    '''Return dictionary of the pending restarts {name: {properties, time}}.'''
+
+    try:
+        _files = sorted(os.listdir(module.params['pending_dir']))
+    except OSError:
+        return {}
+
+    pending = {}
+    for _file in _files:
+        if _file.endswith('.json'):
+            _marker = _read_json(os.path.join(module.params['pending_dir'], _file))
+            pending[_file[:-5]] = _marker if isinstance(_marker, dict) else {}
+
+    return pending
+
+
+def _pending_write(module, name, properties):
+    '''Record the pending restart of the jail name because of the changed properties.'''
+
+    _marker = _read_json(_pending_path(module, name))
+    if not isinstance(_marker, dict):
+        _marker = dict(properties=[])
+    _marker['properties'] = sorted(set(_marker.get('properties', [])) | set(properties))
+    _marker['time'] = time.time()
+    _tmp = None
+    try:
+        os.makedirs(module.params['pending_dir'], mode=0o700, exist_ok=True)
+        _fd, _tmp = tempfile.mkstemp(dir=module.params['pending_dir'], prefix=f".{name}.")
+        with os.fdopen(_fd, 'w') as f:
+            json.dump(_marker, f)
+        os.replace(_tmp, _pending_path(module, name))
+    except OSError as e:
+        if _tmp and os.path.exists(_tmp):
+            os.remove(_tmp)
+        module.fail_json(msg=f"Unable to record the pending restart of the jail '{name}': {e}")
+
+
+def _pending_clear(module, names=None):
+    '''Clear the pending restarts of the jails names or of all jails if names is None.'''
+
+    if names is None:
+        names = list(pending_read(module))
+    for _name in names:
+        try:
+            os.remove(_pending_path(module, _name))
+        except OSError:
+            pass
+
+
+def _restart_mode(module, properties):
+    '''Return how to restart a running jail after the change of the properties or None if the
+       restart is not needed.'''
+
+    _restart = set(properties) & set(RESTART_PROPERTIES)
+    if not _restart:
+        return None
+    mode = module.params.get('restart') or 'immediate'
+    if mode == 'soft' and not _restart <= set(SOFT_RESTART_PROPERTIES):
+        mode = 'immediate'
+
+    return mode
+
+
 def jail_restart(module, iocage_path, name, args=""):
     '''Restarts the specified jails or ALL.
 
@@ -660,16 +2177,15 @@ def jail_restart(module, iocage_path, name, args=""):
     '''
 
     _changed = True
-    cmd = f"{iocage_path} restart"
-    if args:
-        cmd += f" {args}"
-    cmd += f" {name}"
+    cmd = _jail_cmd(iocage_path, 'restart', name, args)
 
     if not module.check_mode:
-        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                          errors='surrogate_or_strict')
+        rc, out, err = _run_command(module, cmd)
+        _facts_cache_invalidate(module, 'jails', 'plugins')
         if rc != 0:
             _command_fail(module, "Jail(s) not restarted.", cmd, rc, out, err)
+        if '-s' not in args.split():
+            _pending_clear(module, None if name == 'ALL' else [name])
         if name == 'ALL':
             _msg = f"ALL jails restarted.\n{cmd}\n{out}"
         else:
@@ -685,15 +2201,116 @@ def jail_restart(module, iocage_path, name, args=""):
     return _changed, _msg, out, err
 
 
-def release_fetch(module, iocage_path, bupdate=False, release=None, components=None, plugin=None, args=""):
-    '''Fetch a version of FreeBSD for jail usage or a preconfigured plugin.
-
-       $ iocage fetch --help
-       Usage: iocage fetch [OPTIONS] [PROPS]...
-       (cont.)
-    '''
+def _release_manifest(path):
+    '''Parse the MANIFEST of a release. Return dictionary {component: SHA-256}.'''
+
+    manifest = {}
+    with open(path) as f:
+        for line in f:
+            _fields = line.split('\t')
+            if len(_fields) > 1:
+                manifest[_fields[0]] = _fields[1]
+
+    return manifest
+
+
+def _release_component_store(module, path, digest, store):
+    '''Copy the component path to store/digest. Verify the SHA-256 digest. Return the stored file.'''
+
+    _stored = os.path.join(store, digest)
+    if os.path.isfile(_stored):
+        return _stored
+
+    _sha256 = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=store, prefix=f".{digest}.")
+    try:
+        with os.fdopen(fd, 'wb') as dst, open(path, 'rb') as src:
+            for _chunk in iter(lambda: src.read(1024 * 1024), b''):
+                _sha256.update(_chunk)
+                dst.write(_chunk)
+        if _sha256.hexdigest() != digest:
+            module.fail_json(msg=f"Component {path} SHA-256 {_sha256.hexdigest()} doesn't match MANIFEST {digest}.")
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, _stored)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    return _stored
+
+
+def release_components_cache(module, release, components=None):
+    '''Populate the components of the release in the cache components_cache from components_mirror.
+       Return the root directory of the releases in the cache and the list of components.'''
+
+    cache = module.params['components_cache']
+    mirror = module.params['components_mirror']
+    if mirror and mirror.startswith('file://'):
+        mirror = mirror[len('file://'):]
+    store = os.path.join(cache, 'sha256')
+    root = os.path.join(cache, 'releases')
+    _release = os.path.join(root, release)
+
+    _manifest = os.path.join(_release, 'MANIFEST')
+    if mirror:
+        _mirror_manifest = os.path.join(mirror, release, 'MANIFEST')
+        if not os.path.isfile(_mirror_manifest):
+            module.fail_json(msg=f"MANIFEST of {release} not found in {mirror}.")
+        _manifest = _mirror_manifest
+    elif not os.path.isfile(_manifest):
+        module.fail_json(msg=f"MANIFEST of {release} not found in {_release}. components_mirror needed.")
+    try:
+        manifest = _release_manifest(_manifest)
+    except OSError as e:
+        module.fail_json(msg=f"Unable to read {_manifest}: {e}")
 
-    _changed = True
+    if components:
+        _components = [os.path.basename(_component) for _component in components if _component != '']
+    else:
+        _components = [_component for _component in ('base.txz', 'lib32.txz', 'src.txz') if _component in manifest]
+    for _component in _components:
+        if _component not in manifest:
+            module.fail_json(msg=f"Component {_component} not listed in MANIFEST of {release}.")
+
+    if module.check_mode or module.params['state'] == 'plan':
+        return root, _components
+
+    try:
+        for _dir in (store, _release):
+            if not os.path.isdir(_dir):
+                os.makedirs(_dir)
+        if _manifest != os.path.join(_release, 'MANIFEST'):
+            shutil.copyfile(_manifest, os.path.join(_release, 'MANIFEST'))
+
+        for _component in _components:
+            _digest = manifest[_component]
+            _stored = os.path.join(store, _digest)
+            if not os.path.isfile(_stored):
+                if not mirror:
+                    module.fail_json(msg=f"Component {_component} of {release} not in cache. "
+                                         "components_mirror needed.")
+                _source = os.path.join(mirror, release, _component)
+                if not os.path.isfile(_source):
+                    module.fail_json(msg=f"Component {_source} not found.")
+                _release_component_store(module, _source, _digest, store)
+            _link = os.path.join(_release, _component)
+            if os.path.exists(_link) and os.path.samefile(_link, _stored):
+                continue
+            if os.path.lexists(_link):
+                os.remove(_link)
+            os.link(_stored, _link)
+    except OSError as e:
+        module.fail_json(msg=f"Unable to populate components_cache {cache} with {release}: {e}")
+
+    return root, _components
+
+
+def _release_fetch_cmd(module, iocage_path, bupdate=False, release=None, components=None, plugin=None, args=""):
+    '''Return the iocage command that fetches the release or the plugin.'''
+
+    if module.params.get('components_cache') and release and not plugin:
+        _root, components = release_components_cache(module, release, components)
+        args += f" -d {_root}"
     if bupdate:
         args += " -U"
     if release:
@@ -704,17 +2321,31 @@ def release_fetch(module, iocage_path, bupdate=False, release=None, components=N
                 args += f" -F {_component}"
     if plugin:
         args += f" -P {plugin}"
-    cmd = f"{iocage_path} fetch {args}"
+
+    return f"{iocage_path} fetch {args}"
+
+
+def release_fetch(module, iocage_path, bupdate=False, release=None, components=None, plugin=None, args=""):
+    '''Fetch a version of FreeBSD for jail usage or a preconfigured plugin.
+
+       $ iocage fetch --help
+       Usage: iocage fetch [OPTIONS] [PROPS]...
+       (cont.)
+    '''
+
+    _changed = True
+    cmd = _release_fetch_cmd(module, iocage_path, bupdate, release, components, plugin, args)
 
     if not module.check_mode:
-        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                          errors='surrogate_or_strict')
+        rc, out, err = _run_command(module, cmd, progress_file=module.params.get('progress_file'),
+                                    output=module.params['output'])
+        _facts_cache_invalidate(module, 'releases', 'plugins')
         if rc != 0:
             _command_fail(module, "Function release_fetch failed.", cmd, rc, out, err)
         if bupdate:
-            _msg = f"Successfully fetched and updated.\n{cmd}\n{out}"
+            _msg = f"Successfully fetched and updated.\n{cmd}"
         else:
-            _msg = f"Successfully fetched.\n{cmd}\n{out}"
+            _msg = f"Successfully fetched.\n{cmd}"
     else:
         out = ""
         err = ""
@@ -726,7 +2357,38 @@ def release_fetch(module, iocage_path, bupdate=False, release=None, components=N
     return _changed, _msg, out, err
 
 
-def jail_exec(module, iocage_path, name, user='root', _cmd='/usr/bin/true'):
+def _jail_target(name, jid=None):
+    '''Return JID of the running jail or its name in jls(8).'''
+
+    if jid and jid not in ('-', 'None'):
+        return jid
+
+    return _jail_jls_name(name)
+
+
+def _jail_exec_prefix(module, iocage_path, name, user='root', jid=None):
+    '''Return the command that executes a command in the jail name.'''
+
+    if module.params.get('exec_backend') == 'jexec':
+        jexec_path = module.get_bin_path('jexec')
+        if jexec_path:
+            return f"{jexec_path} -u {user} {_jail_target(name, jid)}"
+
+    return f"{iocage_path} exec -u {user} {name} --"
+
+
+def _jail_pkg_prefix(module, iocage_path, name, jid=None):
+    '''Return the command that runs pkg in the jail name.'''
+
+    if module.params.get('exec_backend') == 'jexec':
+        pkg_path = module.get_bin_path('pkg')
+        if pkg_path:
+            return f"{pkg_path} -j {_jail_target(name, jid)}"
+
+    return f"{iocage_path} pkg {name}"
+
+
+def jail_exec(module, iocage_path, name, user='root', _cmd='/usr/bin/true', jid=None):
     '''Run a command inside a specified jail.
 
        $ iocage exec --help
@@ -739,14 +2401,13 @@ def jail_exec(module, iocage_path, name, user='root', _cmd='/usr/bin/true'):
     '''
 
     _changed = True
-    cmd = f"{iocage_path} exec -u {user} {name} -- {_cmd}"
+    cmd = f"{_jail_exec_prefix(module, iocage_path, name, user, jid)} {_cmd}"
 
     if not module.check_mode:
-        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                          errors='surrogate_or_strict')
+        rc, out, err = _run_command(module, cmd, output=module.params['output'])
         if rc != 0:
             _command_fail(module, f"Command '{_cmd}' not executed.", cmd, rc, out, err)
-        _msg = f"Jail '{name}' executed command '{_cmd}'\n{cmd}\nrc: {rc}\nstdout:\n{out}\nstderr:\n{err}"
+        _msg = f"Jail '{name}' executed command '{_cmd}'\n{cmd}\nrc: {rc}"
     else:
         out = ""
         err = ""
@@ -755,7 +2416,78 @@ def jail_exec(module, iocage_path, name, user='root', _cmd='/usr/bin/true'):
     return _changed, _msg, out, err
 
 
-def jail_pkg(module, iocage_path, name, _cmd='info'):
+def jail_exec_cmds(module, iocage_path, name, user='root', cmds=None, stop_on_error=False, jid=None):
+    '''Run the commands cmds inside a specified jail in one session. Each command runs in a subshell of
+       /bin/sh. The output of the commands is delimited by markers. Return changed, message, stdout,
+       stderr, and list of the results per command.'''
+
+    if cmds is None:
+        cmds = []
+    _changed = True
+    marker = f"ansible-iocage-{uuid.uuid4().hex}"
+    script = ""
+    for _i, _cmd in enumerate(cmds):
+        script += f"printf '%s begin {_i}\\n' {marker}; printf '%s begin {_i}\\n' {marker} >&2\n"
+        script += f"(\n{_cmd}\n)\n"
+        script += "rc=$?\n"
+        script += f"printf '\\n%s end {_i} %d\\n' {marker} $rc; printf '\\n%s end {_i}\\n' {marker} >&2\n"
+        if stop_on_error:
+            script += "[ $rc -eq 0 ] || exit $rc\n"
+    cmd = f"{_jail_exec_prefix(module, iocage_path, name, user, jid)} /bin/sh -c {shlex.quote(script)}"
+
+    commands = []
+    if not module.check_mode:
+        rc, out, err = _run_command(module, cmd)
+        _stdout = _exec_split(out, marker)
+        _stderr = _exec_split(err, marker)
+        if len(_stdout) == 0:
+            _command_fail(module, f"Commands {cmds} not executed.", cmd, rc, out, err)
+        for _i in sorted(_stdout):
+            (_rc, _out) = _stdout[_i]
+            commands.append(dict(cmd=cmds[_i], rc=_rc, stdout=_out, stderr=_stderr.get(_i, (None, ""))[1]))
+        _failed = [_command['cmd'] for _command in commands if _command['rc'] != 0]
+        out = "".join([_command['stdout'] for _command in commands])
+        err = "".join([_command['stderr'] for _command in commands])
+        if _failed:
+            module.fail_json(msg=f"Jail '{name}' commands {_failed} failed.", commands=commands)
+        _msg = f"Jail '{name}' executed {len(commands)} commands."
+    else:
+        out = ""
+        err = ""
+        _msg = f"Jail '{name}' would execute {len(cmds)} commands.\n{cmd}"
+
+    return _changed, _msg, out, err, commands
+
+
+def _exec_split(out, marker):
+    '''Split the output of jail_exec_cmds. Return dictionary index: (return code, output).
+       The return code is None in the output of stderr or if the command did not finish.'''
+
+    result = {}
+    _index = None
+    _lines = []
+    for line in out.splitlines(True):
+        _fragments = line.split()
+        if len(_fragments) >= 3 and _fragments[0] == marker:
+            if _fragments[1] == 'begin':
+                _index = int(_fragments[2])
+                _lines = []
+                continue
+            if _fragments[1] == 'end' and _index is not None:
+                _rc = int(_fragments[3]) if len(_fragments) > 3 else None
+                # remove the newline printed before the marker
+                result[_index] = (_rc, "".join(_lines)[:-1])
+                _index = None
+                continue
+        if _index is not None:
+            _lines.append(line)
+    if _index is not None:
+        result[_index] = (None, "".join(_lines))
+
+    return result
+
+
+def jail_pkg(module, iocage_path, name, _cmd='info', jid=None):
     '''Use pkg inside a specified jail.
 
        $ iocage pkg --help
@@ -765,14 +2497,13 @@ def jail_pkg(module, iocage_path, name, _cmd='info'):
     '''
 
     _changed = True
-    cmd = f"{iocage_path} pkg {name} {_cmd}"
+    cmd = f"{_jail_pkg_prefix(module, iocage_path, name, jid)} {_cmd}"
 
     if not module.check_mode:
-        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                          errors='surrogate_or_strict')
+        rc, out, err = _run_command(module, cmd, output=module.params['output'])
         if rc != 0:
             _command_fail(module, f"Command 'pkg {_cmd}' not executed.", cmd, rc, out, err)
-        _msg = f"Jail '{name}' executed command 'pkg {_cmd}'\n{cmd}\nrc: {rc}\nstdout:\n{out}\nstderr:\n{err}"
+        _msg = f"Jail '{name}' executed command 'pkg {_cmd}'\n{cmd}\nrc: {rc}"
     else:
         out = ""
         err = ""
@@ -781,29 +2512,66 @@ def jail_pkg(module, iocage_path, name, _cmd='info'):
     return _changed, _msg, out, err
 
 
-def jail_set(module, iocage_path, name, properties=None):
-    '''Sets the specified property.
+def jail_packages(module, iocage_path, name, packages, package_state='present', jid=None):
+    '''Install (present, latest) or delete (absent) the packages in the jail name. Query the
+       installed packages once. Return changed, message, stdout, and stderr.'''
 
-       $ iocage set --help
-       Usage: iocage set [OPTIONS] [PROPS]... JAIL
-       Options:
-         -P, --plugin  Set the specified key for a plugin jail, if accessing a nested key use . as a
-                         separator. Example: iocage set -P foo.bar.baz=VALUE PLUGIN
-         --help        Show this message and exit.
-    '''
+    _prefix = _jail_pkg_prefix(module, iocage_path, name, jid)
+    _verb, _verbed = ('delete', 'deleted') if package_state == 'absent' else ('install', 'installed')
+
+    cmd = f"{_prefix} query '%n %o'"
+    rc, out, err = _run_command(module, cmd, cache=True)
+    if rc != 0:
+        _command_fail(module, f"Packages of jail '{name}' not queried.", cmd, rc, out, err)
+    # name or origin: name
+    installed = {}
+    for line in out.splitlines():
+        _fields = line.split()
+        for _field in _fields:
+            installed[_field] = _fields[0]
+    _packages = [_package for _package in packages if (_package in installed) == (package_state == 'absent')]
+
+    if package_state == 'latest' and len(_packages) < len(packages):
+        # pkg version lists name-version of the outdated packages
+        cmd = f"{_prefix} version -R -l '<'"
+        rc, out, err = _run_command(module, cmd, cache=True)
+        if rc != 0:
+            _command_fail(module, f"Packages of jail '{name}' not compared with the repository.", cmd, rc, out, err)
+        outdated = set(line.split()[0].rsplit('-', 1)[0] for line in out.splitlines() if line.strip())
+        _packages = [_package for _package in packages
+                     if _package not in installed or installed[_package] in outdated]
+
+    if not _packages:
+        return False, f"Jail '{name}' packages {packages} already {package_state}.", "", ""
+
+    cmd = f"{_prefix} {_verb} -y {' '.join([shlex.quote(_package) for _package in _packages])}"
+
+    if not module.check_mode:
+        rc, out, err = _run_command(module, cmd, output=module.params['output'])
+        if rc != 0:
+            _command_fail(module, f"Packages {_packages} not {_verbed}.", cmd, rc, out, err)
+        _msg = f"Jail '{name}' packages {_packages} {_verbed}.\n{cmd}"
+    else:
+        out = ""
+        err = ""
+        _msg = f"Jail '{name}' packages {_packages} would be {_verbed}.\n{cmd}"
+
+    return True, _msg, out, err
+
+
+def _jail_properties_diff(module, name, properties, existing):
+    '''Normalize the properties of the jail name and compare them with the existing properties.
+       Return dictionary of the properties to be changed.'''
 
-    if properties is None:
-        properties = {}
-    _existing_props = _jail_get_properties(module, iocage_path, name)
     _props_to_be_changed = {}
 
     for _property in properties:
-        if _property not in _existing_props:
+        if _property not in existing:
             continue
-        if _existing_props[_property] == '-' and not properties[_property]:
+        if existing[_property] == '-' and not properties[_property]:
             continue
         _val = properties[_property]
-        _oval = _existing_props[_property]
+        _oval = existing[_property]
         if _val in (0, 'no', 'off', False):
             propval = 0
         elif _val in (1, 'yes', 'on', True):
@@ -816,32 +2584,64 @@ def jail_set(module, iocage_path, name, properties=None):
         else:
             module.fail_json(msg="Unable to set attribute {0} to {1} for jail {2}"
                              .format(_property, str(_val).replace("'", "'\\''"), name))
-        if 'CHECK_NEW_JAIL' in _existing_props or \
-           (str(_existing_props[_property]) != str(propval) and propval is not None):
+        if 'CHECK_NEW_JAIL' in existing or \
+           (str(existing[_property]) != str(propval) and propval is not None):
             _props_to_be_changed[_property] = propval
 
+    return _props_to_be_changed
+
+
+def jail_set(module, iocage_path, name, properties=None):
+    '''Sets the specified property.
+
+       $ iocage set --help
+       Usage: iocage set [OPTIONS] [PROPS]... JAIL
+       Options:
+         -P, --plugin  Set the specified key for a plugin jail, if accessing a nested key use . as a
+                         separator. Example: iocage set -P foo.bar.baz=VALUE PLUGIN
+         --help        Show this message and exit.
+    '''
+
+    if properties is None:
+        properties = {}
+    _existing_props = _jail_get_properties(module, iocage_path, name)
+    _props_to_be_changed = _jail_properties_diff(module, name, properties, _existing_props)
+
     if len(_props_to_be_changed) > 0:
         _changed = True
-        if len(list(set(_props_to_be_changed.keys()) & set(['ip4_addr', 'ip6_addr', 'template', 'interfaces', 'vnet', 'host_hostname']))) > 0:
-            need_restart = jail_started(module, iocage_path, name)
-        else:
-            need_restart = False
-
-        cmd = f"{iocage_path} set {_props_to_str(_props_to_be_changed)} {name}"
+        _restart = _restart_mode(module, _props_to_be_changed)
+        _offline, _props = {}, _props_to_be_changed
+        if _restart or module.params.get('properties_writer') == 'config':
+            if not jail_started(module, iocage_path, name):
+                _restart = None
+                _offline, _props = _jail_offline_split(module, _props_to_be_changed, _existing_props)
+
+        if not module.check_mode and _offline and not _jail_config_write(module, name, _offline):
+            _offline, _props = {}, _props_to_be_changed
+        _cmds = [f"config.json {_props_to_str(_offline)}"] if _offline else []
+        _cmds += [f"{iocage_path} set {_props_to_str(_props)} {name}"] if _props else []
+        cmd = "\n".join(_cmds)
 
         if not module.check_mode:
-            if need_restart:
-                jail_stop(module, iocage_path, name)
-            rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                              errors='surrogate_or_strict')
-            if need_restart:
-                jail_start(module, iocage_path, name)
-            if rc != 0:
-                _command_fail(module, "properties not set.", cmd, rc, out, err)
+            _facts_cache_invalidate(module, 'jails', 'templates', 'plugins')
+            if _props:
+                if _restart == 'immediate':
+                    jail_stop(module, iocage_path, name)
+                rc, out, err = _run_command(module, _cmds[-1])
+                if _restart == 'immediate':
+                    jail_start(module, iocage_path, name)
+                if rc != 0:
+                    _command_fail(module, "properties not set.", _cmds[-1], rc, out, err)
+            if _restart == 'soft':
+                jail_restart(module, iocage_path, name, '-s')
+            elif _restart == 'deferred':
+                _pending_write(module, name, _props_to_be_changed)
             _msg = f"properties {str(_props_to_be_changed.keys())} were set in jail '{name}'\n{cmd}"
         else:
             _msg = f"properties {str(_props_to_be_changed.keys())} would be set in jail '{name}'\n{cmd}"
             _msg += str(_props_to_be_changed)
+        if _restart:
+            _msg += f"\nrestart: {_restart}"
 
     else:
         _changed = False
@@ -850,22 +2650,106 @@ def jail_set(module, iocage_path, name, properties=None):
     return _changed, _msg
 
 
-def jail_create(module, iocage_path, name=None, properties=None, clone_from_name=None,
-                clone_from_template=None, release=None, basejail=False, thickjail=False,
-                pkglist=None, args=""):
-    '''Create or clone  a jail.
+def jails_set(module, iocage_path, jails, jail_properties, properties=None):
+    '''Set the properties jail_properties {name: {property: value}} combined with properties. Read
+       the properties of all jails at once. Stop the running jails that need a restart by one
+       command, set the properties concurrently, and start the stopped jails by one command. The
+       concurrent operations only run commands. Return changed, message, and dictionary of the
+       results per jail. Failed commands are reported in the results.'''
+
+    names = list(jail_properties)
+    _existing = _jails_get_properties(module, iocage_path, names)
+
+    results = {}
+    todo = {}
+    for _name in names:
+        _props = {}
+        _props.update(properties or {})
+        _props.update(jail_properties[_name] or {})
+        _diff = _jail_properties_diff(module, _name, _props, _existing[_name])
+        if _diff:
+            todo[_name] = _diff
+        else:
+            results[_name] = dict(changed=False, msg=f"properties {list(_props)} already set in jail '{_name}'")
+    modes = dict((_name, _restart_mode(module, todo[_name])) for _name in todo if jails[_name]['state'] == 'up')
+    restart = [_name for _name in todo if modes.get(_name) == 'immediate']
+    _cmds_stop = [_jail_cmd(iocage_path, 'stop', ' '.join(restart))] if restart else []
+    _cmds_start = [_jail_cmd(iocage_path, 'start', ' '.join(restart))] if restart else []
+    offline = dict((_name, _jail_offline_split(module, todo[_name], _existing[_name])[0])
+                   for _name in todo if jails[_name]['state'] != 'up')
+
+    def _cmds(name, offline=None):
+        cmds = [f"config.json {_props_to_str(offline)}"] if offline else []
+        _props = dict((k, v) for k, v in todo[name].items() if k not in (offline or {}))
+        if _props:
+            cmds.append(f"{iocage_path} set {_props_to_str(_props)} {name}")
+        if modes.get(name) == 'soft':
+            cmds.append(_jail_cmd(iocage_path, 'restart', name, '-s'))
+        return cmds
+
+    def _operation(name):
+        _offline = offline.get(name)
+        if _offline and not _jail_config_write(module, name, _offline):
+            _offline = None
+        cmds = _cmds(name, _offline)
+        rc, out, err = 0, "", ""
+        _start = time.monotonic()
+        for cmd in cmds[1:] if _offline else cmds:
+            rc, out, err = _run_command(module, cmd)
+            if rc != 0:
+                break
+        _elapsed = round(time.monotonic() - _start, 3)
+        if rc != 0:
+            _msg = f"properties {list(todo[name])} not set in jail '{name}'"
+        else:
+            _msg = f"properties {list(todo[name])} were set in jail '{name}'"
+        return dict(changed=True, msg=_msg, properties=todo[name], restart=modes.get(name), cmd=cmds, rc=rc,
+                    stdout=out, stderr=err, elapsed=_elapsed)
+
+    _names = list(todo)
+    if module.check_mode:
+        for _name in _names:
+            results[_name] = dict(changed=True, msg=f"properties {list(todo[_name])} would be set in jail '{_name}'",
+                                  properties=todo[_name], restart=modes.get(_name),
+                                  cmd=_cmds(_name, offline.get(_name)))
+    elif _names:
+        for cmd in _cmds_stop:
+            rc, out, err = _run_command(module, cmd)
+            if rc != 0:
+                _command_fail(module, "Jails not stopped.", cmd, rc, out, err)
+        for _name, _result in zip(_names, _map_parallel(module.params['max_parallel'], _operation, _names)):
+            results[_name] = _result
+        # _pending_write may fail. Call it in the main thread
+        for _name in _names:
+            if modes.get(_name) == 'deferred' and results[_name]['rc'] == 0:
+                _pending_write(module, _name, todo[_name])
+        for cmd in _cmds_start:
+            rc, out, err = _run_command(module, cmd)
+            if rc != 0:
+                _command_fail(module, "Jails not started.", cmd, rc, out, err)
+        _pending_clear(module, restart)
+        _facts_cache_invalidate(module, 'jails', 'templates', 'plugins')
 
-       $ iocage create --help
-       Usage: iocage create [OPTIONS] [PROPS]...
+    _changed = len(_names) > 0
+    if module.check_mode:
+        _msg = f"properties would be set in {len(_names)} of {len(names)} jails"
+    else:
+        _msg = f"properties set in {len(_names)} of {len(names)} jails"
+    if restart and module.check_mode:
+        _msg += f", {len(restart)} would be restarted\n{_cmds_stop[0]}\n{_cmds_start[0]}"
+    elif restart:
+        _msg += f", {len(restart)} restarted"
+    _deferred = [_name for _name in _names if modes.get(_name) == 'deferred']
+    if _deferred:
+        _msg += f", {len(_deferred)} pending restart"
 
-       $ iocage clone --help
-       Usage: iocage clone [OPTIONS] SOURCE [PROPS]...
-       (cont.)
-    '''
+    return _changed, _msg, dict((_name, results[_name]) for _name in names)
 
-    _changed = True
-    _uuid = ""
-    _uuid_short = ""
+
+def _jail_create_cmd(iocage_path, name=None, properties=None, clone_from_name=None,
+                     clone_from_template=None, release=None, basejail=False, thickjail=False,
+                     pkglist=None, args=""):
+    '''Return the iocage command that creates or clones the jail name.'''
 
     if clone_from_name is None and clone_from_template is None:
         if not name:
@@ -902,9 +2786,68 @@ def jail_create(module, iocage_path, name=None, properties=None, clone_from_name
     if properties:
         cmd += f" {_props_to_str(properties)}"
 
+    return cmd
+
+
+def _jail_offline_create_split(module, properties, pkglist=None):
+    '''Split the properties of a jail to be created into the ones written to config.json after the
+       jail is created and the ones passed to iocage. iocage create -p starts the jail to install the
+       packages in pkglist. Pass all properties to iocage then. Return the two dictionaries.'''
+
+    if module.params.get('properties_writer') != 'config' or not properties or pkglist or not _iocage_root(module):
+        return {}, properties
+
+    offline = dict((k, v) for k, v in properties.items() if k not in OFFLINE_UNSAFE_PROPERTIES)
+
+    return offline, dict((k, v) for k, v in properties.items() if k not in offline)
+
+
+def _jail_offline_create_set(module, iocage_path, name, properties):
+    '''Set the properties of the created jail name. Write the properties known in its config.json
+       and defaults.json to config.json. Set the other ones by iocage set. Return rc, stdout,
+       stderr, and the list of the commands.'''
+
+    _existing = _jail_read_properties(_iocage_root(module), name) or {}
+    _offline = _jail_properties_diff(module, name, properties, _existing)
+    _props = dict((k, v) for k, v in properties.items() if k not in _existing)
+    cmds = []
+    if _offline and _jail_config_write(module, name, _offline):
+        cmds.append(f"config.json {_props_to_str(_offline)}")
+    else:
+        _props.update(_offline)
+    if not _props:
+        return 0, "", "", cmds
+
+    cmds.append(f"{iocage_path} set {_props_to_str(_props)} {name}")
+    rc, out, err = _run_command(module, cmds[-1])
+
+    return rc, out, err, cmds
+
+
+def jail_create(module, iocage_path, name=None, properties=None, clone_from_name=None,
+                clone_from_template=None, release=None, basejail=False, thickjail=False,
+                pkglist=None, args=""):
+    '''Create or clone  a jail.
+
+       $ iocage create --help
+       Usage: iocage create [OPTIONS] [PROPS]...
+
+       $ iocage clone --help
+       Usage: iocage clone [OPTIONS] SOURCE [PROPS]...
+       (cont.)
+    '''
+
+    _changed = True
+    _uuid = ""
+    _uuid_short = ""
+
+    _offline, properties = _jail_offline_create_split(module, properties, pkglist)
+    cmd = _jail_create_cmd(iocage_path, name, properties, clone_from_name, clone_from_template, release,
+                           basejail, thickjail, pkglist, args)
+
     if not module.check_mode:
-        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                          errors='surrogate_or_strict')
+        rc, out, err = _run_command(module, cmd)
+        _facts_cache_invalidate(module, 'jails', 'templates', 'plugins')
         if rc != 0:
             _command_fail(module, "Jail not created.", cmd, rc, out, err)
         _msg = f"'Jail was created.\n{cmd}\n{out}"
@@ -913,18 +2856,107 @@ def jail_create(module, iocage_path, name=None, properties=None, clone_from_name
             _uuid_short = _uuid.split('-')[0]
             name = _uuid_short
             cmd = f"{iocage_path} rename {_uuid} {_uuid_short}"
-            rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                              errors='surrogate_or_strict')
+            rc, out, err = _run_command(module, cmd)
             if rc != 0:
                 _command_fail(module, "Jail not renamed.", cmd, rc, out, err)
-        if not jail_exists(module, iocage_path, name):
-            module.fail_json(msg=f"'{name}' not created ???\ncmd: {cmd}\nstdout:\n{out}\nstderr:\n{err}")
+        if _offline:
+            rc, out, err, _cmds = _jail_offline_create_set(module, iocage_path, name, _offline)
+            if rc != 0:
+                _command_fail(module, "properties not set.", _cmds[-1], rc, out, err)
+            _msg += "\n".join([""] + _cmds)
     else:
         _msg = f"Jail would be created.\n{cmd}"
+        if _offline:
+            _msg += f"\nconfig.json {_props_to_str(_offline)}"
 
     return _changed, _msg, _uuid, _uuid_short
 
 
+def jails_clone(module, iocage_path, jails, count, name_pattern=None, properties=None, jail_properties=None,
+                clone_from_name=None, clone_from_template=None, pkglist=None, args=""):
+    '''Clone count jails named by name_pattern from the jail clone_from_name or from the template
+       clone_from_template. Create the missing jails and set the properties of the existing ones by
+       jails_set. Run up to max_parallel operations concurrently. The operations only run commands.
+       Failed commands are reported in the results. Return changed, message, dictionary of the
+       results per jail, and list of the created jails.'''
+
+    if jail_properties is None:
+        jail_properties = {}
+
+    if name_pattern:
+        try:
+            names = [name_pattern % _index for _index in range(1, count + 1)]
+        except (TypeError, ValueError) as e:
+            module.fail_json(msg=f"Invalid name_pattern '{name_pattern}': {e}")
+    else:
+        names = [None] * count
+
+    def _properties(name):
+        _props = {}
+        _props.update(properties or {})
+        _props.update(jail_properties.get(name, {}))
+        return _props
+
+    existing = [_name for _name in names if _name in jails]
+    _set_msg = None
+    _set_results = {}
+    if existing:
+        _set_properties = dict((_name, jail_properties.get(_name, {})) for _name in existing)
+        _set_changed, _set_msg, _set_results = jails_set(module, iocage_path, jails, _set_properties, properties)
+
+    def _operation(name):
+        _offline, _props = _jail_offline_create_split(module, _properties(name), pkglist)
+        cmds = [_jail_create_cmd(iocage_path, name, _props, clone_from_name, clone_from_template,
+                                 pkglist=pkglist, args=args)]
+        if module.check_mode:
+            if _offline:
+                cmds.append(f"config.json {_props_to_str(_offline)}")
+            return dict(changed=True, msg=f"Jail '{name or ''}' would be created.", cmd=cmds)
+        _start = time.monotonic()
+        rc, out, err = _run_command(module, cmds[0])
+        _uuid = out.split()[0] if rc == 0 and out.split() else ""
+        if rc != 0:
+            _msg = f"Jail '{name or ''}' not created."
+        else:
+            _msg = f"Jail '{name or _uuid}' created."
+        if rc == 0 and _offline:
+            rc, out, err, _cmds = _jail_offline_create_set(module, iocage_path, name or _uuid, _offline)
+            cmds += _cmds
+            if rc != 0:
+                _msg += " properties not set."
+        _elapsed = round(time.monotonic() - _start, 3)
+        return dict(changed=True, msg=_msg, cmd=cmds, rc=rc, stdout=out, stderr=err, elapsed=_elapsed,
+                    uuid=_uuid)
+
+    _new = [_index for _index, _name in enumerate(names) if _name not in jails]
+    _created = dict(zip(_new, _map_parallel(module.params['max_parallel'], _operation, [names[_i] for _i in _new])))
+    if not module.check_mode:
+        _facts_cache_invalidate(module, 'jails', 'templates', 'plugins')
+
+    results = {}
+    created = []
+    for _index, _name in enumerate(names):
+        if _index not in _created:
+            results[_name] = _set_results[_name]
+            continue
+        _result = _created[_index]
+        if _name is None:
+            _name = _result.get('uuid') or f"{_index + 1}"
+        results[_name] = _result
+        if _result.get('rc', 0) == 0:
+            created.append(_name)
+
+    _changed = any(_result['changed'] for _result in results.values())
+    if module.check_mode:
+        _msg = f"{len(created)} of {count} jails would be created."
+    else:
+        _msg = f"{len(created)} of {count} jails created."
+    if _set_msg:
+        _msg += f" {_set_msg[0].upper()}{_set_msg[1:]}."
+
+    return _changed, _msg, results, created
+
+
 def jail_update(module, iocage_path, name):
     '''Run freebsd-update to update a specified jail to the latest patch level.
 
@@ -940,8 +2972,8 @@ def jail_update(module, iocage_path, name):
     cmd = f"{iocage_path} update {name}"
 
     if not module.check_mode:
-        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                          errors='surrogate_or_strict')
+        rc, out, err = _run_command(module, cmd, progress_file=module.params.get('progress_file'))
+        _facts_cache_invalidate(module, 'jails', 'plugins')
         if "No updates needed" in out:
             _changed = False
             _msg = f"Jail '{name}' is up-to-date.\n{out}"
@@ -973,19 +3005,15 @@ def jail_destroy(module, iocage_path, name, args=""):
     '''
 
     _changed = True
-    _args = '--force'
-    if args:
-        _args += f" {args}"
-    cmd = f"{iocage_path} destroy {_args} {name}"
+    cmd = _jail_cmd(iocage_path, 'destroy', name, args)
 
     if not module.check_mode:
-        rc, out, err = module.run_command(to_bytes(cmd, errors='surrogate_or_strict'),
-                                          errors='surrogate_or_strict')
+        rc, out, err = _run_command(module, cmd)
+        _facts_cache_invalidate(module, 'jails', 'templates', 'plugins')
         if rc != 0:
             _command_fail(module, f"'{name}' not destroyed.", cmd, rc, out, err)
+        _pending_clear(module, [name])
         _msg = f"'{name}' was destroyed.\n{out}"
-        if jail_exists(module, iocage_path, name):
-            module.fail_json(msg=f"'{name}' not destroyed ???\ncmd: {cmd}\nstdout:\n{out}\nstderr:\n{err}")
     else:
         out = ""
         err = ""
@@ -994,12 +3022,362 @@ def jail_destroy(module, iocage_path, name, args=""):
     return _changed, _msg, out, err
 
 
+def jails_lifecycle(module, iocage_path, jails, state, names, args=""):
+    '''Start, stop, restart, or destroy (state) the jails names. Skip the jails already in the target
+       state. Run up to max_parallel operations concurrently. Return changed, message, and dictionary
+       of the results per jail. Failed commands are reported in the results.'''
+
+    _verbs = dict(started=('start', 'started'), stopped=('stop', 'stopped'),
+                  restarted=('restart', 'restarted'), absent=('destroy', 'destroyed'))
+    (_command, _verb) = _verbs[state]
+
+    results = {}
+    todo = []
+    for _name in names:
+        if state == 'started' and jails[_name]['state'] == 'up':
+            results[_name] = dict(changed=False, msg=f"Jail '{_name}' already started.")
+        elif state == 'stopped' and jails[_name]['state'] == 'down':
+            results[_name] = dict(changed=False, msg=f"Jail '{_name}' already stopped.")
+        elif state == 'absent' and _name not in jails:
+            results[_name] = dict(changed=False, msg=f"'{_name}' already destroyed.")
+        else:
+            todo.append(_name)
+
+    def _operation(name):
+        cmds = []
+        if state == 'absent' and jails[name]['state'] == 'up':
+            cmds.append(_jail_cmd(iocage_path, 'stop', name))
+        cmds.append(_jail_cmd(iocage_path, _command, name, args))
+        if module.check_mode:
+            return dict(changed=True, msg=f"Jail '{name}' would be {_verb}.", cmd=cmds)
+        rc, out, err = 0, "", ""
+        _start = time.monotonic()
+        for cmd in cmds:
+            rc, out, err = _run_command(module, cmd)
+            if rc != 0:
+                break
+        _elapsed = round(time.monotonic() - _start, 3)
+        if rc != 0:
+            _msg = f"Jail '{name}' not {_verb}."
+        else:
+            if _command != 'start':
+                _pending_clear(module, [name])
+            _msg = f"Jail '{name}' {_verb}."
+        return dict(changed=True, msg=_msg, cmd=cmds, rc=rc, stdout=out, stderr=err, elapsed=_elapsed)
+
+    for _name, _result in zip(todo, _map_parallel(module.params['max_parallel'], _operation, todo)):
+        results[_name] = _result
+    if todo and not module.check_mode:
+        _facts_cache_invalidate(module, 'jails', 'templates', 'plugins')
+
+    _changed = len(todo) > 0
+    if module.check_mode:
+        _msg = f"{len(todo)} of {len(names)} jails would be {_verb}."
+    else:
+        _msg = f"{len(todo)} of {len(names)} jails {_verb}."
+
+    return _changed, _msg, dict((_name, results[_name]) for _name in names)
+
+
+def _jails_tiers(module, iocage_path, jails, state, names):
+    '''Split the jails names into tiers by the properties priority and depends. A jail starts after
+       the jails of smaller priority and after the jails it depends on. A jail that depends on a
+       jail of greater priority starts in the priority of that jail. The jails stop in the reverse
+       order. Return list of tuples (priority, list of jails) in the order of execution.'''
+
+    _missing = [_name for _name in names
+                if not set(('priority', 'depends')) <= set(jails[_name].get('properties', {}))]
+    _properties = _jails_get_properties(module, iocage_path, _missing)
+    _properties.update((_name, jails[_name]['properties']) for _name in names if _name not in _properties)
+
+    priority = {}
+    depends = {}
+    for _name in names:
+        try:
+            priority[_name] = int(_properties[_name].get('priority', 99))
+        except ValueError:
+            priority[_name] = 99
+        depends[_name] = [_dep for _dep in re.split(r'[\s,]+', _properties[_name].get('depends', 'none'))
+                          if _dep in names and _dep != _name]
+
+    # effective priority is not smaller than the priorities of the dependencies
+    effective = {}
+
+    def _effective(name, stack):
+        if name in effective:
+            return effective[name]
+        if name in stack:
+            module.fail_json(msg=f"Circular dependency of jails: {stack + [name]}")
+        effective[name] = max([priority[name]] + [_effective(_dep, stack + [name]) for _dep in depends[name]])
+        return effective[name]
+
+    for _name in names:
+        _effective(_name, [])
+
+    # longest path in the graph of the priority order and the depends edges
+    level = {}
+
+    def _level(name, base):
+        if name not in level:
+            level[name] = max([base] + [_level(_dep, base) + 1 for _dep in depends[name]])
+        return level[name]
+
+    base = 0
+    for _priority in sorted(set(effective.values())):
+        for _name in [_name for _name in names if effective[_name] == _priority]:
+            _level(_name, base)
+        base = max(level.values()) + 1
+
+    tiers = []
+    for _level_ in sorted(set(level.values()), reverse=(state == 'stopped')):
+        _jails = [_name for _name in names if level[_name] == _level_]
+        tiers.append((effective[_jails[0]], _jails))
+
+    return tiers
+
+
+def jails_schedule(module, iocage_path, jails, state, names, args=""):
+    '''Start or stop (state) the jails names in tiers. See _jails_tiers. Run up to max_parallel
+       operations of a tier concurrently. Verify the jails of a tier are up or down before the next
+       tier. Return changed, message, dictionary of the results per jail, and the schedule.'''
+
+    _command = 'start' if state == 'started' else 'stop'
+    _verb = state
+    _target = 'up' if state == 'started' else 'down'
+    args = " ".join([_arg for _arg in args.split() if _arg != '--rc'])
+
+    results = {}
+    todo = []
+    for _name in names:
+        if jails[_name]['state'] == _target:
+            results[_name] = dict(changed=False, msg=f"Jail '{_name}' already {_verb}.")
+        else:
+            todo.append(_name)
+
+    def _operation(name):
+        cmd = _jail_cmd(iocage_path, _command, name, args)
+        if module.check_mode:
+            return dict(changed=True, msg=f"Jail '{name}' would be {_verb}.", cmd=[cmd])
+        _start = time.monotonic()
+        rc, out, err = _run_command(module, cmd)
+        _elapsed = round(time.monotonic() - _start, 3)
+        if rc != 0:
+            _msg = f"Jail '{name}' not {_verb}."
+        else:
+            if _command != 'start':
+                _pending_clear(module, [name])
+            _msg = f"Jail '{name}' {_verb}."
+        return dict(changed=True, msg=_msg, cmd=[cmd], rc=rc, stdout=out, stderr=err, elapsed=_elapsed)
+
+    schedule = dict(tiers=[], critical_path=0, elapsed=0)
+    _start = time.monotonic()
+    for (_priority, _jails) in _jails_tiers(module, iocage_path, jails, state, todo):
+        _results = _map_parallel(module.params['max_parallel'], _operation, _jails)
+        results.update(zip(_jails, _results))
+        _elapsed = max([_result.get('elapsed', 0) for _result in _results])
+        schedule['tiers'].append(dict(jails=_jails, priority=_priority, elapsed=_elapsed))
+        schedule['critical_path'] = round(schedule['critical_path'] + _elapsed, 3)
+        if module.check_mode:
+            continue
+        _facts_cache_invalidate(module, 'jails', 'plugins')
+        probe = _jails_probe(module)
+        if probe is not None:
+            _up = [_name for _name in _jails if _jail_jls_name(_name) in probe]
+        else:
+            _rows = _get_iocage_facts(module, iocage_path, 'jails', gather=())
+            _up = [_name for _name in _jails if _rows.get(_name, {}).get('state') == 'up']
+        _failed = [_name for _name in _jails
+                   if results[_name]['rc'] != 0 or (_name in _up) != (_target == 'up')]
+        if _failed:
+            schedule['elapsed'] = round(time.monotonic() - _start, 3)
+            module.fail_json(msg=f"Jails {_failed} not {_verb}.", jails=results, schedule=schedule)
+    schedule['elapsed'] = round(time.monotonic() - _start, 3)
+
+    _changed = len(todo) > 0
+    if module.check_mode:
+        _msg = f"{len(todo)} of {len(names)} jails would be {_verb} in {len(schedule['tiers'])} tiers."
+    else:
+        _msg = f"{len(todo)} of {len(names)} jails {_verb} in {len(schedule['tiers'])} tiers."
+
+    return _changed, _msg, dict((_name, results[_name]) for _name in names), schedule
+
+
+def _plan_validate(module, operations):
+    '''Validate the operations of the state plan.'''
+
+    for _index, _operation in enumerate(operations):
+        _label = f"operations[{_index}]"
+        if _operation.get('op') not in PLAN_OPERATIONS:
+            module.fail_json(msg=f"{_label}: op must be one of {', '.join(PLAN_OPERATIONS)}, "
+                                 f"got: {_operation.get('op')}")
+        _unknown = sorted(set(_operation) - set(PLAN_KEYS))
+        if _unknown:
+            module.fail_json(msg=f"{_label}: unsupported keys {_unknown}")
+        if _operation['op'] != 'fetch' and not _operation.get('name'):
+            module.fail_json(msg=f"{_label}: name needed for op {_operation['op']}")
+        if _operation['op'] == 'clone' and not _operation.get('clone_from'):
+            module.fail_json(msg=f"{_label}: clone_from needed for op clone")
+        if _operation.get('properties') is not None and not isinstance(_operation['properties'], dict):
+            module.fail_json(msg=f"{_label}: properties must be a dictionary")
+
+
+def jails_plan(module, iocage_path, facts, operations):
+    '''Evaluate the operations against the facts without changing anything. Apply the operations
+       one by one to a copy of the jails, templates, and releases. Build the commands by the
+       builders of the states. Read the properties only of the jails the operations set. Return
+       changed, message, and the list of the results per operation.'''
+
+    jails = dict((_name, dict(_item)) for _name, _item in facts.get('iocage_jails', {}).items())
+    templates = dict((_name, dict(_item)) for _name, _item in facts.get('iocage_templates', {}).items())
+    releases = list(facts.get('iocage_releases', []))
+    _release = []
+
+    def _item(name):
+        return jails.get(name) or templates.get(name)
+
+    def _default_release(release):
+        if release:
+            return release
+        if not _release:
+            _release.append(_host_release(module))
+        return _release[0]
+
+    _missing = []
+    for _operation in operations:
+        _name = _operation.get('name')
+        _props = _operation.get('properties') or {}
+        if _operation['op'] in ('create', 'clone', 'set') and _props and _item(_name) is not None:
+            if not set(_props) <= set(_item(_name).get('properties', {})) and _name not in _missing:
+                _missing.append(_name)
+    for _name, _properties in _jails_get_properties(module, iocage_path, _missing).items():
+        _item(_name)['properties'] = _properties
+
+    def _fetch(release, components=None):
+        releases.append(release)
+        return [_release_fetch_cmd(module, iocage_path, False, release, components)]
+
+    def _set(name, properties):
+        item = _item(name)
+        # the properties of the jails created by the plan are not known
+        _existing = item.get('properties')
+        if _existing is None:
+            _existing = dict.fromkeys(properties, '')
+        _diff = _jail_properties_diff(module, name, properties, _existing)
+        if not _diff:
+            return False, f"properties {list(properties)} already set in jail '{name}'", []
+
+        _restart = _restart_mode(module, _diff)
+        _offline, _props = {}, _diff
+        if item['state'] != 'up':
+            _restart = None
+            _offline, _props = _jail_offline_split(module, _diff, _existing)
+        cmds = [_jail_cmd(iocage_path, 'stop', name)] if _restart == 'immediate' else []
+        cmds += [f"config.json {_props_to_str(_offline)}"] if _offline else []
+        cmds += [f"{iocage_path} set {_props_to_str(_props)} {name}"] if _props else []
+        if _restart == 'immediate':
+            cmds.append(_jail_cmd(iocage_path, 'start', name))
+        elif _restart == 'soft':
+            cmds.append(_jail_cmd(iocage_path, 'restart', name, '-s'))
+        if item.get('properties') is not None:
+            item['properties'] = dict(item['properties'], **dict((k, f"{v}") for k, v in _diff.items()))
+        _msg = f"properties {list(_diff)} would be set in jail '{name}'"
+        if _restart:
+            _msg += f"\nrestart: {_restart}"
+        return True, _msg, cmds
+
+    def _create(operation):
+        name = operation['name']
+        properties = operation.get('properties') or {}
+        if _item(name) is not None:
+            if not properties:
+                return False, "Jail already exists.", []
+            return _set(name, properties)
+
+        cmds = []
+        clone_from = operation.get('clone_from')
+        clone_from_name = clone_from if clone_from in jails else None
+        clone_from_template = clone_from if clone_from in templates else None
+        release = None
+        if clone_from and not (clone_from_name or clone_from_template):
+            return None, f"Unable to create jail.\nbasejail '{clone_from}' doesn't exist.", []
+        if not clone_from:
+            release = _default_release(operation.get('release'))
+            if release not in releases:
+                cmds += _fetch(release, operation.get('components'))
+        _offline, _props = _jail_offline_create_split(module, properties, operation.get('pkglist'))
+        cmds.append(_jail_create_cmd(iocage_path, name, _props, clone_from_name, clone_from_template, release,
+                                     pkglist=operation.get('pkglist'), args=operation.get('args') or ""))
+        if _offline:
+            cmds.append(f"config.json {_props_to_str(_offline)}")
+        _items = templates if str(properties.get('template')) in ('1', 'yes', 'on', 'True') else jails
+        _items[name] = dict(name=name, state='down', properties=None)
+        return True, "Jail would be created.", cmds
+
+    def _lifecycle(operation):
+        name = operation['name']
+        _command = operation['op']
+        if name not in jails:
+            return None, f"Jail '{name}' doesn't exist.", []
+        _target = dict(start='up', stop='down').get(_command)
+        _verb = dict(start='started', stop='stopped', restart='restarted')[_command]
+        if jails[name]['state'] == _target:
+            return False, f"Jail '{name}' already {_verb}.", []
+        jails[name]['state'] = _target or 'up'
+        cmd = _jail_cmd(iocage_path, _command, name, operation.get('args') or "")
+        return True, f"Jail '{name}' would be {_verb}.", [cmd]
+
+    def _absent(operation):
+        name = operation['name']
+        item = _item(name)
+        if item is None:
+            return False, f"'{name}' already destroyed.", []
+        cmds = [_jail_cmd(iocage_path, 'stop', name)] if item['state'] == 'up' else []
+        cmds.append(_jail_cmd(iocage_path, 'destroy', name, operation.get('args') or ""))
+        jails.pop(name, None)
+        templates.pop(name, None)
+        return True, f"Jail '{name}' would be destroyed.", cmds
+
+    def _fetched(operation):
+        release = _default_release(operation.get('release'))
+        if release in releases:
+            return False, f"Release {release} already fetched.", []
+        return True, f"Release {release} would be fetched.", _fetch(release, operation.get('components'))
+
+    plan = []
+    for _index, _operation in enumerate(operations):
+        _op = _operation['op']
+        if _op in ('create', 'clone'):
+            _changed, _msg, _cmds = _create(_operation)
+        elif _op == 'set':
+            if _item(_operation['name']) is None:
+                _changed, _msg, _cmds = None, f"Jail '{_operation['name']}' doesn't exist.", []
+            else:
+                _changed, _msg, _cmds = _set(_operation['name'], _operation.get('properties') or {})
+        elif _op in ('start', 'stop', 'restart'):
+            _changed, _msg, _cmds = _lifecycle(_operation)
+        elif _op == 'absent':
+            _changed, _msg, _cmds = _absent(_operation)
+        else:
+            _changed, _msg, _cmds = _fetched(_operation)
+        _result = dict(op=_op, name=_operation.get('name') or _operation.get('release'), changed=bool(_changed),
+                       msg=_msg, cmd=_cmds)
+        plan.append(_result)
+        if _changed is None:
+            _result['failed'] = True
+            module.fail_json(msg=f"operations[{_index}]: {_msg}", plan=plan)
+
+    _count = len([_result for _result in plan if _result['changed']])
+    _msg = f"{_count} of {len(plan)} operations would change."
+
+    return _count > 0, _msg, plan
+
+
 def run_module():
 
     module_args = dict(
         state=dict(type='str', default='facts',
                    choices=['absent', 'basejail', 'cloned', 'exec', 'facts', 'fetched', 'get', 'pkg',
-                            'present', 'restarted', 'set', 'started', 'stopped', 'template',
+                            'plan', 'present', 'progress', 'restarted', 'set', 'started', 'stopped', 'template',
                             'thickjail']),
         name=dict(type='str'),
         pkglist=dict(type='path'),
@@ -1007,13 +3385,51 @@ def run_module():
         args=dict(type='str', default=''),
         user=dict(type='str', default='root'),
         cmd=dict(type='str'),
+        cmds=dict(type='list', elements='str'),
+        stop_on_error=dict(type='bool', default=False),
+        exec_backend=dict(type='str', default='iocage', choices=['iocage', 'jexec']),
+        packages=dict(type='list', elements='str'),
+        package_state=dict(type='str', default='present', choices=['present', 'absent', 'latest']),
         clone_from=dict(type='str'),
+        count=dict(type='int'),
+        name_pattern=dict(type='str'),
+        jail_properties=dict(type='dict'),
+        operations=dict(type='list', elements='dict'),
         plugin=dict(type='str'),
         release=dict(type='str'),
         bupdate=dict(type='bool', default=False),
-        components=dict(type='list', elements='path', aliases=['files', 'component']),)
-
-    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
+        components=dict(type='list', elements='path', aliases=['files', 'component']),
+        components_cache=dict(type='path'),
+        components_mirror=dict(type='str'),
+        facts_workers=dict(type='int', default=4),
+        gather=dict(type='list', elements='str', default=['all'],
+                    choices=['all', 'minimal', 'jails', 'templates', 'plugins', 'releases', 'properties']),
+        facts_format=dict(type='str', default='full', choices=['full', 'compact', 'none']),
+        facts_properties=dict(type='list', elements='str'),
+        facts_since=dict(type='str'),
+        properties_backend=dict(type='str', default='cli', choices=['cli', 'config']),
+        properties_writer=dict(type='str', default='cli', choices=['cli', 'config']),
+        iocroot=dict(type='path'),
+        names=dict(type='list', elements='str'),
+        max_parallel=dict(type='int', default=4),
+        parallel=dict(type='bool', default=False),
+        restart=dict(type='str', default='immediate', choices=['immediate', 'deferred', 'soft', 'never']),
+        pending_dir=dict(type='path', default='/var/db/ansible-iocage/pending'),
+        pending_only=dict(type='bool', default=False),
+        facts_cache=dict(type='bool', default=False),
+        facts_cache_dir=dict(type='path', default='/var/cache/ansible-iocage'),
+        facts_cache_ttl=dict(type='int', default=300),
+        progress_file=dict(type='path'),
+        output=dict(type='str', default='full'),
+        timings=dict(type='bool', default=False),
+        profile=dict(type='bool', default=False),
+        profile_file=dict(type='path', default='/tmp/ansible-iocage.prof'),)
+
+    module = AnsibleModule(argument_spec=module_args,
+                           mutually_exclusive=[('name', 'names'), ('cmd', 'cmds'), ('cmd', 'packages'),
+                                               ('name', 'count'), ('names', 'count'), ('name', 'jail_properties')],
+                           required_by=dict(name_pattern='count'),
+                           supports_check_mode=True)
 
     iocage_path = module.get_bin_path('iocage', True)
     if not iocage_path:
@@ -1031,42 +3447,122 @@ def run_module():
     bupdate = p['bupdate']
     components = p['components']
     pkglist = p['pkglist']
+    names = p['names']
+
+    if p['facts_workers'] < 1:
+        module.fail_json(msg=f"facts_workers must be greater than 0. Got: {p['facts_workers']}")
+    if p['max_parallel'] < 1:
+        module.fail_json(msg=f"max_parallel must be greater than 0. Got: {p['max_parallel']}")
+    if _output_mode(p['output'])[0] is None:
+        module.fail_json(msg=f"output must be one of full, tail:N, summary, file:<path>, got: {p['output']}")
+
+    if p['profile']:
+        profiler = cProfile.Profile()
+        atexit.register(_profile_dump, profiler, p['profile_file'])
+        profiler.enable()
+    if p['timings'] or module._debug:
+        _run_cache['timings'] = dict(phase=None, start=None, phases={}, commands=[], counts={})
 
     # Gather facts
 
     _changed = False
     out = ""
     err = ""
-    facts = _get_iocage_facts(module, iocage_path, 'all')
+
+    if p['state'] == 'progress':
+        if not p['progress_file']:
+            module.fail_json(msg="progress_file needed for state progress")
+        _progress = progress_read(module, p['progress_file'])
+        if _progress['cmd'] is None:
+            _msg = f"No progress in {p['progress_file']}."
+        elif _progress['done']:
+            _msg = f"Command '{_progress['cmd']}' finished. rc: {_progress['rc']}"
+        else:
+            _msg = f"Command '{_progress['cmd']}' running. phase: {_progress['phase']}"
+        module.exit_json(changed=False, msg=_msg, progress=_progress)
+
+    _timings_phase('gather')
+    gather = _gather_artifacts(p['gather'], p['state'], bupdate, p['facts_format'], p['facts_properties'])
+    facts = _get_iocage_facts(module, iocage_path, 'all', gather=gather)
     facts['iocage_states'] = module_args['state']['choices']
 
     if p['state'] == 'facts':
-        result = dict(ansible_facts=facts,
+        result = dict(ansible_facts=_facts_format(facts, p['facts_format']),
                       changed=_changed,
                       msg="",
                       stdout=out,
                       stderr=err,
                       )
+        if p['facts_since'] is not None:
+            result['ansible_facts'], result['iocage_delta'] = _facts_delta(module, result['ansible_facts'],
+                                                                           p['facts_since'])
         if module._debug:
             result['module_args'] = f"{(json.dumps(module.params, indent=4))}"
+            result['command_cache'] = _run_cache.get('command_stats', dict(hits=0, misses=0))
+        if 'timings' in _run_cache:
+            result['timings'] = _timings_result()
         module.exit_json(**result)
 
+    _timings_phase('action')
     jails = {}
-    jails.update(facts['iocage_jails'])
-    jails.update(facts['iocage_templates'])
+    jails.update(facts.get('iocage_jails', {}))
+    jails.update(facts.get('iocage_templates', {}))
 
     # Input validation
 
+    # states that accept list of jails
+    if names is not None:
+        if p['state'] not in ('started', 'stopped', 'restarted', 'absent'):
+            module.fail_json(msg=f"names not supported by state {p['state']}")
+        if p['state'] != 'absent':
+            for _name in names:
+                if _name not in jails:
+                    module.fail_json(msg=f"Jail '{_name}' doesn't exist.")
+
+    # start or stop the jails with boot=on
+    rc_jails = p['state'] in ('started', 'stopped') and '--rc' in args.split()
+
+    # set the properties of the jails jail_properties
+    for _name, _properties in (p['jail_properties'] or {}).items():
+        if not isinstance(_properties, dict):
+            module.fail_json(msg=f"jail_properties of the jail '{_name}' must be a dictionary")
+    bulk_set = p['state'] == 'set' and p['jail_properties'] is not None
+    if bulk_set:
+        for _name in p['jail_properties']:
+            if _name not in jails:
+                module.fail_json(msg=f"Jail '{_name}' doesn't exist.")
+
+    # evaluate the operations
+    if p['operations'] is not None and p['state'] != 'plan':
+        module.fail_json(msg=f"operations not supported by state {p['state']}")
+    if p['state'] == 'plan':
+        if not p['operations']:
+            module.fail_json(msg="operations needed for state plan")
+        _plan_validate(module, p['operations'])
+
+    # restart the jails with pending restart
+    if p['pending_only'] and p['state'] != 'restarted':
+        module.fail_json(msg=f"pending_only not supported by state {p['state']}")
+
     # states that need name of jail
     if p['state'] in ('started', 'stopped', 'restarted', 'get', 'set', 'exec', 'pkg', 'absent'):
-        if name is None:
+        if name is None and names is None and not rc_jails and not bulk_set and not p['pending_only']:
             module.fail_json(msg=f"name needed for state {p['state']}")
 
+    # mass clone
+    if p['count'] is not None:
+        if p['state'] != 'cloned':
+            module.fail_json(msg=f"count not supported in state {p['state']}")
+        if p['count'] < 1:
+            module.fail_json(msg=f"count must be greater than 0, got: {p['count']}")
+        if clone_from not in jails:
+            module.fail_json(msg=f"Unable to create jails.\nbasejail '{clone_from}' doesn't exist.")
+
     # states that need existing jail
-    if p['state'] in ('started', 'stopped', 'restarted'):
-        if name != 'ALL' and name not in jails:
+    if p['state'] in ('started', 'stopped', 'restarted') and names is None and not rc_jails:
+        if name != 'ALL' and name not in jails and not (p['pending_only'] and name is None):
             module.fail_json(msg=f"Jail '{name}' doesn't exist.")
-    if p['state'] in ('get', 'set', 'exec', 'pkg'):
+    if p['state'] in ('get', 'set', 'exec', 'pkg') and not bulk_set:
         if name not in jails:
             module.fail_json(msg=f"Jail '{name}' doesn't exist.")
     if name and bupdate:
@@ -1081,70 +3577,142 @@ def run_module():
     # states that need release defined
     if p['state'] in ('basejail', 'thickjail', 'template', 'fetched', 'present') or bupdate:
         if not release:
-            rc, out, err = module.run_command("uname -r")
-            if rc != 0:
-                module.fail_json(msg="Unable to run uname -r ???")
-            matches = re.match(r'(\d+\.\d+)\-(RELEASE|RC\d+).*', out.strip())
-            if matches:
-                release = matches.group(1) + '-RELEASE'
-            else:
-                module.fail_json(msg=f"Release not recognised: {out}")
+            release = _host_release(module)
 
     # Execution of states
 
     msgs = []
     _uuid = ''
     _uuid_short = ''
-
-    if p['state'] == 'started':
+    _results = None
+    _created = None
+    _schedule = None
+    _commands = None
+    _plan = None
+
+    if p['state'] in ('started', 'stopped') and p['parallel'] and (name == 'ALL' or rc_jails):
+        if rc_jails:
+            _names = [_name for _name in facts['iocage_jails'] if facts['iocage_jails'][_name]['boot'] == 'on']
+        else:
+            _names = list(facts['iocage_jails'].keys())
+        _changed, _msg, _results, _schedule = jails_schedule(module, iocage_path, jails, p['state'], _names, args)
+        msgs.append(_msg)
+        if _changed and not module.check_mode:
+            facts['iocage_jails'] = _jails_state_refresh(module, iocage_path, facts, None, gather)
+
+    elif p['pending_only']:
+        _pending = pending_read(module)
+        if names is not None:
+            _names = [_name for _name in names if _name in _pending]
+        elif name and name != 'ALL':
+            _names = [name] if name in _pending else []
+        else:
+            _names = list(_pending)
+        _running = [_name for _name in _names if _name in jails and jails[_name]['state'] == 'up']
+        _changed, _msg, _results = jails_lifecycle(module, iocage_path, jails, 'restarted', _running, args)
+        for _name in _names:
+            if _name not in _running:
+                _results[_name] = dict(changed=False, msg=f"Jail '{_name}' not running. Pending restart cleared.")
+        if not module.check_mode:
+            _pending_clear(module, [_name for _name in _names if _name not in _running])
+        msgs.append(_msg if _names else "No pending restarts.")
+        if _changed and not module.check_mode:
+            facts['iocage_jails'] = _jails_state_refresh(module, iocage_path, facts, None, gather)
+            _failed = [_name for _name in _running
+                       if _results[_name].get('rc', 0) != 0 or facts['iocage_jails'][_name]['state'] != 'up']
+            if _failed:
+                module.fail_json(msg=f"Jails {_failed} not restarted.", jails=_results)
+
+    elif names is not None:
+        _changed, _msg, _results = jails_lifecycle(module, iocage_path, jails, p['state'], names, args)
+        msgs.append(_msg)
+        if _changed and not module.check_mode:
+            if p['state'] != 'absent':
+                facts['iocage_jails'] = _jails_state_refresh(module, iocage_path, facts, None, gather)
+            else:
+                for _artifact in ('jails', 'templates'):
+                    if any(_name in facts[f"iocage_{_artifact}"] for _name in names):
+                        facts[f"iocage_{_artifact}"] = _facts_refresh(module, iocage_path, facts, _artifact, None,
+                                                                      gather)
+            jails = {}
+            jails.update(facts['iocage_jails'])
+            jails.update(facts['iocage_templates'])
+            _failed = []
+            for _name in names:
+                if _results[_name].get('rc', 0) != 0:
+                    _failed.append(_name)
+                elif p['state'] == 'absent' and _name in jails:
+                    _failed.append(_name)
+                elif p['state'] in ('started', 'restarted') and jails[_name]['state'] != 'up':
+                    _failed.append(_name)
+                elif p['state'] == 'stopped' and jails[_name]['state'] != 'down':
+                    _failed.append(_name)
+            if _failed:
+                module.fail_json(msg=f"Jails {_failed} not {p['state']}.", jails=_results)
+
+    elif p['state'] == 'started':
         if name == 'ALL' and _all_jails_started(facts):
             msgs.append("All jails already started.")
-        elif name != 'ALL' and jails[name]['state'] == 'up':
+        elif name and name != 'ALL' and jails[name]['state'] == 'up':
             msgs.append(f"Jail '{name}' already started.")
         else:
             _changed, _msg, out, err = jail_start(module, iocage_path, name, args)
             msgs.append(_msg)
-        if not module.check_mode:
-            facts['iocage_jails'] = _get_iocage_facts(module, iocage_path, 'jails')
+        if _changed and not module.check_mode:
+            facts['iocage_jails'] = _jails_state_refresh(module, iocage_path, facts, name, gather)
             jails.update(facts['iocage_jails'])
             if name == 'ALL' and not _all_jails_started(facts):
                 module.fail_json(msg=f"ALL jails are not started.\n{out}\n{err}")
-            elif name != 'ALL' and jails[name]['state'] != 'up':
+            elif not name and not _all_jails_started(facts, boot=True):
+                module.fail_json(msg=f"Jails with boot=on are not started.\n{out}\n{err}")
+            elif name and name != 'ALL' and jails[name]['state'] != 'up':
                 module.fail_json(msg=f"Jail '{name}' is not started.\n{out}\n{err}")
 
     elif p['state'] == 'stopped':
         if name == 'ALL' and _all_jails_stopped(facts):
             msgs.append("All jails already stopped.")
-        elif name != 'ALL' and jails[name]['state'] == 'down':
+        elif name and name != 'ALL' and jails[name]['state'] == 'down':
             msgs.append(f"Jail '{name}' already stopped.")
         else:
             _changed, _msg, out, err = jail_stop(module, iocage_path, name, args)
             msgs.append(_msg)
-        if not module.check_mode:
-            facts['iocage_jails'] = _get_iocage_facts(module, iocage_path, 'jails')
+        if _changed and not module.check_mode:
+            facts['iocage_jails'] = _jails_state_refresh(module, iocage_path, facts, name, gather)
             jails.update(facts['iocage_jails'])
             if name == 'ALL' and not _all_jails_stopped(facts):
                 module.fail_json(msg=f"ALL jails are not stopped.\n{out}\n{err}")
-            elif name != 'ALL' and jails[name]['state'] != 'down':
+            elif not name and not _all_jails_stopped(facts, boot=True):
+                module.fail_json(msg=f"Jails with boot=on are not stopped.\n{out}\n{err}")
+            elif name and name != 'ALL' and jails[name]['state'] != 'down':
                 module.fail_json(msg=f"Jail '{name}' is not stopped.\n{out}\n{err}")
 
     elif p['state'] == 'restarted':
         _changed, _msg, out, err = jail_restart(module, iocage_path, name, args)
         msgs.append(_msg)
         if not module.check_mode:
-            facts['iocage_jails'] = _get_iocage_facts(module, iocage_path, 'jails')
+            facts['iocage_jails'] = _jails_state_refresh(module, iocage_path, facts, name, gather)
             jails.update(facts['iocage_jails'])
             if name == 'ALL' and not _all_jails_started(facts):
                 module.fail_json(msg=f"ALL jails are not up.\n{out}\n{err}")
             elif name != 'ALL' and jails[name]['state'] != 'up':
                 module.fail_json(msg=f"Restarting jail '{name}' failed.\n{out}\n{err}")
 
+    elif p['state'] == 'exec' and p['cmds'] is not None:
+        _changed, _msg, out, err, _commands = jail_exec_cmds(module, iocage_path, name, user, p['cmds'],
+                                                             p['stop_on_error'], jails[name]['jid'])
+        msgs.append(_msg)
+
     elif p['state'] == 'exec':
-        _changed, _msg, out, err = jail_exec(module, iocage_path, name, user, cmd)
+        _changed, _msg, out, err = jail_exec(module, iocage_path, name, user, cmd, jails[name]['jid'])
+        msgs.append(_msg)
+
+    elif p['state'] == 'pkg' and p['packages'] is not None:
+        _changed, _msg, out, err = jail_packages(module, iocage_path, name, p['packages'], p['package_state'],
+                                                 jails[name]['jid'])
         msgs.append(_msg)
 
     elif p['state'] == 'pkg':
-        _changed, _msg, out, err = jail_pkg(module, iocage_path, name, cmd)
+        _changed, _msg, out, err = jail_pkg(module, iocage_path, name, cmd, jails[name]['jid'])
         msgs.append(_msg)
 
     elif p['state'] == 'fetched':
@@ -1153,7 +3721,7 @@ def run_module():
             _changed, _msg, out, err = release_fetch(module, iocage_path, bupdate, release, components, None, args)
             msgs.append(_msg)
             if not module.check_mode:
-                facts['iocage_releases'] = _get_iocage_facts(module, iocage_path, 'releases')
+                facts['iocage_releases'] = _get_iocage_facts(module, iocage_path, 'releases', gather=gather)
                 if release not in facts['iocage_releases']:
                     module.fail_json(msg=f"Fetching release {release} failed.\n{out}\n{err}")
         else:
@@ -1164,20 +3732,59 @@ def run_module():
                 _changed, _msg, out, err = release_fetch(module, iocage_path, bupdate, None, None, plugin, args)
                 msgs.append(_msg)
                 if not module.check_mode:
-                    facts['iocage_plugins'] = _get_iocage_facts(module, iocage_path, 'plugins')
+                    facts['iocage_plugins'] = _get_iocage_facts(module, iocage_path, 'plugins', gather=gather)
                     if plugin not in facts['iocage_plugins']:
                         module.fail_json(msg=f"Fetching plugin {plugin} failed.\n{out}\n{err}")
             else:
                 msgs.append(f"Plugin {plugin} already fetched.")
 
+    elif p['state'] == 'plan':
+        # nothing is changed. The results of the operations predict the changes
+        _would_change, _msg, _plan = jails_plan(module, iocage_path, facts, p['operations'])
+        msgs.append(_msg)
+
     elif p['state'] == 'get':
         facts['iocage_properties'] = _jail_get_properties(module, iocage_path, name)
 
+    elif bulk_set:
+        _changed, _msg, _results = jails_set(module, iocage_path, jails, p['jail_properties'], properties)
+        msgs.append(_msg)
+        if _changed and not module.check_mode:
+            for _artifact in ('jails', 'templates'):
+                _items = facts[f"iocage_{_artifact}"]
+                _refresh = [_name for _name in _results if _results[_name]['changed'] and _name in _items]
+                if _refresh:
+                    for _name in _refresh:
+                        _items[_name].pop('properties', None)
+                    facts[f"iocage_{_artifact}"] = _facts_refresh(module, iocage_path, facts, _artifact, None, gather)
+            _failed = [_name for _name in _results if _results[_name].get('rc', 0) != 0]
+            if _failed:
+                module.fail_json(msg=f"Properties of the jails {_failed} not set.", jails=_results)
+
     elif p['state'] == 'set':
         _changed, _msg = jail_set(module, iocage_path, name, properties)
         msgs.append(_msg)
-        if not module.check_mode:
-            facts['iocage_jails'] = _get_iocage_facts(module, iocage_path, 'jails')
+        if _changed and not module.check_mode:
+            _artifact = 'templates' if name in facts['iocage_templates'] else 'jails'
+            facts[f"iocage_{_artifact}"] = _facts_refresh(module, iocage_path, facts, _artifact, name, gather)
+
+    elif p['state'] == 'cloned' and p['count'] is not None:
+        clone_from_name = clone_from if clone_from in facts['iocage_jails'] else None
+        clone_from_template = clone_from if clone_from in facts['iocage_templates'] else None
+        _changed, _msg, _results, _created = jails_clone(module, iocage_path, jails, p['count'], p['name_pattern'],
+                                                         properties, p['jail_properties'], clone_from_name,
+                                                         clone_from_template, pkglist, args)
+        msgs.append(_msg)
+        if _changed and not module.check_mode:
+            for _artifact in ('jails', 'templates'):
+                _items = facts[f"iocage_{_artifact}"]
+                for _name in _results:
+                    if _results[_name]['changed'] and _name in _items:
+                        _items[_name].pop('properties', None)
+                facts[f"iocage_{_artifact}"] = _facts_refresh(module, iocage_path, facts, _artifact, None, gather)
+            _failed = [_name for _name in _results if _results[_name].get('rc', 0) != 0]
+            if _failed:
+                module.fail_json(msg=f"Jails {_failed} not created or set.", jails=_results, created=_created)
 
     elif p['state'] in ('present', 'cloned', 'template', 'basejail', 'thickjail'):
 
@@ -1187,10 +3794,10 @@ def run_module():
         clone_from_template = None
 
         if p['state'] != 'cloned' and release not in facts['iocage_releases']:
-            _changed, _msg = release_fetch(module, iocage_path, bupdate, release, components)
+            _changed, _msg, out, err = release_fetch(module, iocage_path, bupdate, release, components)
             msgs.append(_msg)
-            if _changed:
-                facts['iocage_releases'] = _get_iocage_facts(module, iocage_path, 'releases')
+            if _changed and not module.check_mode:
+                facts['iocage_releases'] = _get_iocage_facts(module, iocage_path, 'releases', gather=gather)
 
         if p['state'] == 'template':
             if properties is None:
@@ -1215,7 +3822,9 @@ def run_module():
                 else:
                     module.fail_json(msg=f"Unable to create jail.\nbasejail '{clone_from}' doesn't exist.")
 
+        _new_jail = False
         if name not in jails:
+            _new_jail = True
             _changed, _msg, _uuid, _uuid_short = jail_create(module, iocage_path, name, properties, clone_from_name,
                                                              clone_from_template, release, do_basejail, do_thickjail,
                                                              pkglist, args)
@@ -1228,18 +3837,22 @@ def run_module():
 
         if bupdate:
             if release not in facts['iocage_releases']:
-                _changed, _msg = release_fetch(module, iocage_path, bupdate, release, components)
-                if _changed:
+                _changed, _msg, out, err = release_fetch(module, iocage_path, bupdate, release, components)
+                if _changed and not module.check_mode:
                     msgs.append(_msg)
-                    facts['iocage_releases'] = _get_iocage_facts(module, iocage_path, 'releases')
+                    facts['iocage_releases'] = _get_iocage_facts(module, iocage_path, 'releases', gather=gather)
             _changed, _msg = jail_update(module, iocage_path, name)
             msgs.append(_msg)
 
-        if _changed:
-            if p['state'] == 'template':
-                facts['iocage_templates'] = _get_iocage_facts(module, iocage_path, 'templates')
-            else:
-                facts['iocage_jails'] = _get_iocage_facts(module, iocage_path, 'jails')
+        if _changed and not module.check_mode:
+            _name = name or _uuid_short
+            _artifact = 'templates' if p['state'] == 'template' else 'jails'
+            facts[f"iocage_{_artifact}"] = _facts_refresh(module, iocage_path, facts, _artifact, _name, gather)
+            if _new_jail and _name not in facts[f"iocage_{_artifact}"]:
+                _other = 'jails' if _artifact == 'templates' else 'templates'
+                facts[f"iocage_{_other}"] = _facts_refresh(module, iocage_path, facts, _other, _name, gather)
+                if _name not in facts[f"iocage_{_other}"]:
+                    module.fail_json(msg=f"'{_name}' not created ???\n{_msg}")
 
     elif p['state'] == 'absent':
         if name not in jails:
@@ -1251,20 +3864,40 @@ def run_module():
                 msgs.append(_msg)
             _changed, _msg, out, err = jail_destroy(module, iocage_path, name, args)
             msgs.append(_msg)
-        if not module.check_mode:
-            facts['iocage_jails'] = _get_iocage_facts(module, iocage_path, 'jails')
-            facts['iocage_templates'] = _get_iocage_facts(module, iocage_path, 'templates')
+        if _changed and not module.check_mode:
+            _artifact = 'templates' if name in facts['iocage_templates'] else 'jails'
+            facts[f"iocage_{_artifact}"] = _facts_refresh(module, iocage_path, facts, _artifact, name, gather)
             if name in facts['iocage_jails'] or name in facts['iocage_templates']:
                 module.fail_json(msg=f"'{name}' not destroyed.\n{out}\n{err}")
 
-    result = dict(ansible_facts=facts,
+    result = dict(ansible_facts=_facts_format(facts, p['facts_format']),
                   changed=_changed,
                   msg=", ".join(msgs),
                   stdout=out,
                   stderr=err,
                   )
+    if p['facts_since'] is not None:
+        result['ansible_facts'], result['iocage_delta'] = _facts_delta(module, result['ansible_facts'],
+                                                                       p['facts_since'])
     if module._debug:
         result['module_args'] = f"{(json.dumps(module.params, indent=4))}"
+        result['command_cache'] = _run_cache.get('command_stats', dict(hits=0, misses=0))
+    if _results is not None:
+        result['jails'] = _results
+    if _schedule is not None:
+        result['schedule'] = _schedule
+    if _created is not None:
+        result['created'] = _created
+    if _plan is not None:
+        result['plan'] = _plan
+    if p['restart'] == 'deferred' or p['pending_only']:
+        result['pending'] = sorted(pending_read(module))
+    if p['output'] != 'full' and 'output' in _run_cache:
+        result['output'] = _run_cache['output']
+    if 'timings' in _run_cache:
+        result['timings'] = _timings_result()
+    if _commands is not None and not module.check_mode:
+        result['commands'] = _commands
     if len(_uuid) > 0:
         result['uuid'] = f"{_uuid}"
         result['uuid_short'] = f"{_uuid_short}"
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Benchmark of the module iocage on the simulator test/sim.
+
+   Run the module for the states facts, set, started (name=ALL), and cloned on 10, 100, and 1000
+   jails. Report the wall time, the number of the iocage calls, and the number of all commands
+   run by the module (timings). Requires ansible-core. Runs on any POSIX host.
+
+   shell> python3 test/bench/bench.py
+   shell> python3 test/bench/bench.py --sizes 10,100 --latency 0.05 --extra '{"gather": ["minimal"]}'
+   shell> python3 test/bench/bench.py --config-backend
+'''
+
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SIM = os.path.join(os.path.dirname(HERE), 'sim')
+MODULE = os.path.join(os.path.dirname(os.path.dirname(HERE)), 'iocage.py')
+
+sys.path.insert(0, SIM)
+import iocage_sim  # noqa: E402
+
+STATES = dict(
+    facts=dict(state='facts'),
+    set=dict(state='set', name='j0001', properties=dict(notes='bench')),
+    started=dict(state='started', name='ALL'),
+    cloned=dict(state='cloned', name='bench', clone_from='tpl'),
+)
+
+
+def run_module(state_dir, module_args, latency=0):
+    '''Run the module with module_args on the simulator in state_dir. Return the result, the wall
+       time, and the number of the iocage calls.'''
+
+    env = dict(os.environ)
+    env['PATH'] = os.path.join(SIM, 'bin') + os.pathsep + env.get('PATH', '')
+    env['IOCAGE_SIM_STATE'] = state_dir
+    env['IOCAGE_SIM_LATENCY'] = str(latency)
+    os.environ['IOCAGE_SIM_STATE'] = state_dir
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(dict(ANSIBLE_MODULE_ARGS=module_args), f)
+    _calls = len(iocage_sim.calls())
+    try:
+        _start = time.monotonic()
+        proc = subprocess.run([sys.executable, MODULE, f.name], env=env, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, universal_newlines=True)
+        _elapsed = time.monotonic() - _start
+    finally:
+        os.remove(f.name)
+    try:
+        result = json.loads(proc.stdout)
+    except ValueError:
+        result = dict(failed=True, msg=(proc.stdout + proc.stderr).strip()[-500:])
+
+    return result, _elapsed, len(iocage_sim.calls()) - _calls
+
+
+def bench(state, size, latency=0, repeat=1, extra=None, config_backend=False):
+    '''Benchmark the state on size jails. Return dictionary.'''
+
+    walls = []
+    for _ in range(repeat):
+        state_dir = tempfile.mkdtemp(prefix='iocage-bench-')
+        try:
+            os.environ['IOCAGE_SIM_STATE'] = state_dir
+            iocage_sim.populate(size)
+            module_args = dict(STATES[state], timings=True)
+            module_args.update(extra or {})
+            if config_backend:
+                module_args.update(properties_backend='config', iocroot=iocage_sim.iocroot())
+            result, _elapsed, _calls = run_module(state_dir, module_args, latency)
+        finally:
+            shutil.rmtree(state_dir)
+        if result.get('failed'):
+            return dict(state=state, jails=size, failed=True, msg=result.get('msg'))
+        walls.append(_elapsed)
+
+    _timings = result.get('timings', {})
+    return dict(state=state, jails=size, wall=round(statistics.median(walls), 3), iocage_calls=_calls,
+                commands=sum(_timings.get('counts', {}).values()), phases=_timings.get('phases', {}),
+                changed=result.get('changed'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,1000', help='numbers of jails (default: 10,100,1000)')
+    parser.add_argument('--states', default=','.join(STATES), help=f"states (default: {','.join(STATES)})")
+    parser.add_argument('--latency', type=float, default=0, help='delay of each iocage call in seconds')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per case. The median is reported')
+    parser.add_argument('--extra', default='{}', help='JSON dictionary of additional module arguments')
+    parser.add_argument('--config-backend', action='store_true',
+                        help='read the properties from config.json of the simulated iocroot')
+    parser.add_argument('--output', help='write the results as JSON lines to the file')
+    args = parser.parse_args()
+
+    if importlib.util.find_spec('ansible') is None:
+        sys.exit("ansible-core is required. pip install ansible-core")
+
+    results = []
+    print(f"{'state':10} {'jails':>6} {'wall[s]':>9} {'iocage':>7} {'commands':>9}  phases")
+    for _size in [int(_size) for _size in args.sizes.split(',')]:
+        for _state in args.states.split(','):
+            result = bench(_state, _size, args.latency, args.repeat, json.loads(args.extra), args.config_backend)
+            results.append(result)
+            if result.get('failed'):
+                print(f"{_state:10} {_size:>6} FAILED: {result['msg']}")
+                continue
+            print(f"{_state:10} {_size:>6} {result['wall']:>9.3f} {result['iocage_calls']:>7} "
+                  f"{result['commands']:>9}  {result['phases']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Stand-in for the iocage CLI. Keep the jails in a state directory.
+
+   The state directory is $IOCAGE_SIM_STATE (default /tmp/iocage-sim):
+
+     iocroot/defaults.json                      default properties
+     iocroot/jails/<name>/config.json           properties of a jail or a plugin (type pluginv2)
+     iocroot/templates/<name>/config.json       properties of a template
+     state.json                                 running jails, releases, packages, outdated packages
+     calls.log                                  one line per call
+
+   $IOCAGE_SIM_LATENCY is the delay of each call in seconds.
+   The formats of the output are the formats parsed by the module iocage.
+
+   host() answers the host commands jls, jexec, pkg -j, and zfs on the same state. They are not
+   logged in calls.log.
+'''
+
+import fcntl
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+DEFAULTS = dict(
+    allow_sysvipc=0, basejail=0, boot=0, defaultrouter='none', depends='none', host_hostname='none',
+    interfaces='vnet0:bridge0', ip4_addr='none', ip6_addr='none', notes='none', priority=99,
+    template=0, type='jail', vnet=0,
+)
+
+HOST_BINS = ('jls', 'jexec', 'pkg', 'zfs')
+
+_call_lock = threading.Lock()
+
+
+def state_dir():
+    '''Return the state directory.'''
+
+    return os.environ.get('IOCAGE_SIM_STATE', '/tmp/iocage-sim')
+
+
+def iocroot():
+    '''Return the simulated iocage root.'''
+
+    return os.path.join(state_dir(), 'iocroot')
+
+
+def _load():
+    try:
+        with open(os.path.join(state_dir(), 'state.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return dict(releases=[], run={}, next_jid=1, pkgs={})
+
+
+def _save(st):
+    _tmp = os.path.join(state_dir(), 'state.json.tmp')
+    with open(_tmp, 'w') as f:
+        json.dump(st, f)
+    os.replace(_tmp, os.path.join(state_dir(), 'state.json'))
+
+
+def _config_path(name):
+    for _kind in ('jails', 'templates'):
+        _path = os.path.join(iocroot(), _kind, name, 'config.json')
+        if os.path.exists(_path):
+            return _path, _kind
+    return None, None
+
+
+def _read_config(name):
+    with open(_config_path(name)[0]) as f:
+        return json.load(f)
+
+
+def _write_config(name, config, kind='jails'):
+    _dir = os.path.join(iocroot(), kind, name)
+    os.makedirs(_dir, exist_ok=True)
+    with open(os.path.join(_dir, 'config.json'), 'w') as f:
+        json.dump(config, f, sort_keys=True)
+
+
+def _properties(name):
+    with open(os.path.join(iocroot(), 'defaults.json')) as f:
+        properties = json.load(f)
+    properties.update(_read_config(name))
+    return properties
+
+
+def _names(kind):
+    _dir = os.path.join(iocroot(), kind)
+    return sorted(os.listdir(_dir)) if os.path.isdir(_dir) else []
+
+
+def _parse_properties(args):
+    properties = {}
+    for _arg in args:
+        _key, _value = _arg.split('=', 1)
+        properties[_key] = int(_value) if _value.isdigit() else _value
+    return properties
+
+
+def _row(st, name, long=True, columns=10):
+    '''Return the row of the jail name in iocage list -h (long=False), -hl (10 columns), -hlt
+       (9 columns), or -hP (11 columns).'''
+
+    props = _properties(name)
+    jid = st['run'].get(name)
+    _jid = str(jid) if jid else '-'
+    _state = 'up' if jid else 'down'
+    _ip4 = props.get('ip4_addr', 'none')
+    _ip4 = '-' if _ip4 == 'none' else _ip4
+    if not long:
+        return '\t'.join([_jid, name, _state, props.get('release', '-'), _ip4])
+    _boot = 'on' if str(props.get('boot')) in ('1', 'on') else 'off'
+    _row = [_jid, name, _boot, _state, props.get('type', 'jail'), props.get('release', '-'), _ip4, '-',
+            props.get('source_template') or '-', 'yes' if str(props.get('basejail')) == '1' else 'no']
+    if columns == 11:
+        _portal = f"http://{_ip4.split('|')[-1].split('/')[0]}" if _ip4 != '-' else '-'
+        _row[9:] = [_portal, f"https://www.freshports.org/{props.get('plugin_name', name)}"]
+    return '\t'.join(_row[:columns])
+
+
+def init(releases=None):
+    '''Create an empty state directory with the releases.'''
+
+    for _kind in ('jails', 'templates'):
+        os.makedirs(os.path.join(iocroot(), _kind), exist_ok=True)
+    with open(os.path.join(iocroot(), 'defaults.json'), 'w') as f:
+        json.dump(DEFAULTS, f)
+    _save(dict(releases=list(releases or []), run={}, next_jid=1, pkgs={}))
+
+
+def _plugin(st, name, release, ip4_addr='none'):
+    _write_config(name, dict(release=release, host_hostuuid=name, type='pluginv2', plugin_name=name,
+                             ip4_addr=ip4_addr, boot=0))
+    st['run'][name] = st['next_jid']
+    st['next_jid'] += 1
+
+
+def populate(count, release='13.4-RELEASE', template='tpl', running=False, pattern='j%04d', plugins=0):
+    '''Create the template and count jails cloned from it, and the running plugins p01..pNN, without
+       running the CLI. Return the names of the jails.'''
+
+    init([release])
+    _write_config(template, dict(release=release, template=1, host_hostuuid=template), 'templates')
+    st = _load()
+    names = [pattern % _index for _index in range(1, count + 1)]
+    for _index, _name in enumerate(names):
+        _write_config(_name, dict(release=release, host_hostuuid=_name, source_template=template,
+                                  priority=_index % 3, boot=1))
+        if running:
+            st['run'][_name] = st['next_jid']
+            st['next_jid'] += 1
+    for _index in range(1, plugins + 1):
+        _plugin(st, 'p%02d' % _index, release, f"vnet0|10.0.1.{_index}/24")
+    _save(st)
+    return names
+
+
+def outdated(name, packages):
+    '''Install the packages in the jail name as older than the repository.'''
+
+    st = _load()
+    installed = st['pkgs'].setdefault(name, ['pkg'])
+    installed.extend([_package for _package in packages if _package not in installed])
+    st.setdefault('outdated', {})[name] = list(packages)
+    _save(st)
+
+
+def calls():
+    '''Return the list of the calls logged in the state directory.'''
+
+    try:
+        with open(os.path.join(state_dir(), 'calls.log')) as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def _list(st, args):
+    _flag = args[0]
+    if _flag == '-hr':
+        for _release in st['releases']:
+            print(_release)
+    elif _flag == '-hlt':
+        for _name in _names('templates'):
+            print(_row(st, _name, columns=9))
+    elif _flag == '-hP':
+        for _name in _names('jails'):
+            if _read_config(_name).get('type') == 'pluginv2':
+                print(_row(st, _name, columns=11))
+    elif _flag in ('-hl', '-h'):
+        for _name in _names('jails'):
+            print(_row(st, _name, long=_flag == '-hl'))
+    return 0
+
+
+def _get(st, args):
+    name = args[-1]
+    if _config_path(name)[0] is None:
+        print(f"{name} not found!", file=sys.stderr)
+        return 1
+    properties = _properties(name)
+    if args[0] == '--all':
+        for _key, _value in sorted(properties.items()):
+            print(f"{_key}:{_value}")
+    else:
+        print(properties.get(args[0], name))
+    return 0
+
+
+def _create(st, command, args):
+    name = source = template = release = None
+    props = []
+    _index = 0
+    if command == 'clone':
+        source = args[0]
+        _index = 1
+    while _index < len(args):
+        _arg = args[_index]
+        if _arg in ('-n', '-r', '-t', '-p'):
+            _value = args[_index + 1]
+            if _arg == '-n':
+                name = _value
+            elif _arg == '-r':
+                release = _value
+            elif _arg == '-t':
+                template = _value
+            _index += 2
+            continue
+        if not _arg.startswith('-'):
+            props.append(_arg)
+        _index += 1
+    _uuid = str(uuid.uuid4())
+    name = name or _uuid
+    if _config_path(name)[0] is not None:
+        print(f"Jail: {name} already exists!", file=sys.stderr)
+        return 1
+    config = {}
+    if template:
+        if _config_path(template)[0] is None:
+            print(f"Template: {template} not found!", file=sys.stderr)
+            return 1
+        config.update(_read_config(template))
+        config.update(template=0, source_template=template)
+    elif source:
+        if _config_path(source)[0] is None:
+            print(f"{source} not found!", file=sys.stderr)
+            return 1
+        config.update(_read_config(source))
+    else:
+        if release not in st['releases']:
+            print(f"Release {release} not found!", file=sys.stderr)
+            return 1
+        config['release'] = release
+    config['host_hostuuid'] = name
+    config.update(_parse_properties(props))
+    _write_config(name, config, 'templates' if str(config.get('template')) == '1' else 'jails')
+    print(f"{name} successfully created!")
+    return 0
+
+
+def _set(st, args):
+    name = args[-1]
+    _path, _kind = _config_path(name)
+    if _path is None:
+        print(f"{name} not found!", file=sys.stderr)
+        return 1
+    config = _read_config(name)
+    config.update(_parse_properties(args[:-1]))
+    with open(_path, 'w') as f:
+        json.dump(config, f, sort_keys=True)
+    _new_kind = 'templates' if str(config.get('template')) == '1' else 'jails'
+    if _new_kind != _kind:
+        os.rename(os.path.dirname(_path), os.path.join(iocroot(), _new_kind, name))
+    return 0
+
+
+def _lifecycle(st, command, args):
+    flags = [_arg for _arg in args if _arg.startswith('-')]
+    targets = [_arg for _arg in args if not _arg.startswith('-')]
+    if '--rc' in flags:
+        names = [_name for _name in _names('jails') if str(_properties(_name).get('boot')) in ('1', 'on')]
+    elif targets == ['ALL']:
+        names = _names('jails')
+    else:
+        names = targets
+    for _name in names:
+        if _config_path(_name)[0] is None:
+            print(f"{_name} not found!", file=sys.stderr)
+            return 1
+        if command == 'stop':
+            st['run'].pop(_name, None)
+        elif command == 'start' and _name in st['run']:
+            continue
+        else:
+            st['run'][_name] = st['next_jid']
+            st['next_jid'] += 1
+        print(f"* {command.capitalize()} {_name}")
+    return 0
+
+
+def _destroy(st, args):
+    name = args[-1]
+    _path = _config_path(name)[0]
+    if _path is None:
+        print(f"{name} not found!", file=sys.stderr)
+        return 1
+    os.remove(_path)
+    os.rmdir(os.path.dirname(_path))
+    st['run'].pop(name, None)
+    return 0
+
+
+def _pkg(st, args):
+    name = args[0]
+    _command = args[1:]
+    installed = st['pkgs'].setdefault(name, ['pkg'])
+    if _command[0] == 'query':
+        for _package in installed:
+            print(f"{_package} {'ports-mgmt' if _package == 'pkg' else 'misc'}/{_package}")
+    elif _command[0] == 'version':
+        for _package in st.get('outdated', {}).get(name, []):
+            print(f"{_package}-1.0\t<")
+    elif _command[0] == 'install':
+        _outdated = st.get('outdated', {}).get(name, [])
+        _new = [_package for _package in _command[1:]
+                if not _package.startswith('-') and (_package not in installed or _package in _outdated)]
+        if '-n' not in _command:
+            installed.extend(_package for _package in _new if _package not in installed)
+            _outdated[:] = [_package for _package in _outdated if _package not in _new]
+        if not _new:
+            print("The most recent versions of packages are already installed")
+    elif _command[0] == 'delete':
+        for _package in _command[1:]:
+            if _package in installed:
+                installed.remove(_package)
+    else:
+        print(f"pkg {' '.join(_command)}")
+    return 0
+
+
+def run(st, args):
+    '''Run the iocage command args on the state st. Return the exit code.'''
+
+    command = args[0]
+    args = args[1:]
+    if command == 'list':
+        return _list(st, args)
+    if command == 'get':
+        return _get(st, args)
+    if command in ('create', 'clone'):
+        return _create(st, command, args)
+    if command == 'rename':
+        _path, _kind = _config_path(args[0])
+        os.rename(os.path.dirname(_path), os.path.join(iocroot(), _kind, args[1]))
+        return 0
+    if command == 'set':
+        return _set(st, args)
+    if command in ('start', 'stop', 'restart'):
+        return _lifecycle(st, command, args)
+    if command == 'destroy':
+        return _destroy(st, args)
+    if command == 'exec':
+        proc = subprocess.run(args[args.index('--') + 1:], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+        sys.stdout.write(proc.stdout)
+        sys.stderr.write(proc.stderr)
+        return proc.returncode
+    if command == 'pkg':
+        return _pkg(st, args)
+    if command == 'fetch':
+        if '-r' in args:
+            _release = args[args.index('-r') + 1]
+            if _release not in st['releases']:
+                st['releases'].append(_release)
+        if '-P' in args:
+            _name = args[args.index('-P') + 1]
+            if _config_path(_name)[0] is None:
+                _plugin(st, _name, st['releases'][-1] if st['releases'] else '-')
+        print("Fetching: done")
+        return 0
+    if command == 'update':
+        print("No updates needed")
+        return 0
+    print(f"Unsupported command: {command}", file=sys.stderr)
+    return 2
+
+
+def main(argv=None):
+    '''Entry point of the stand-in iocage executable.'''
+
+    args = sys.argv[1:] if argv is None else argv
+    if not os.path.exists(os.path.join(iocroot(), 'defaults.json')):
+        init()
+    with open(os.path.join(state_dir(), 'calls.log'), 'a') as f:
+        f.write(' '.join(args) + '\n')
+    _latency = float(os.environ.get('IOCAGE_SIM_LATENCY', '0'))
+    if _latency:
+        time.sleep(_latency)
+    with open(os.path.join(state_dir(), 'lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        st = _load()
+        try:
+            return run(st, args)
+        finally:
+            _save(st)
+
+
+def _jls_name(name):
+    return f"ioc-{name.replace('.', '_')}"
+
+
+def _host_target(st, target):
+    for _name, _jid in st['run'].items():
+        if target in (str(_jid), _jls_name(_name)):
+            return _name
+    return None
+
+
+def _host(st, args):
+    command = os.path.basename(args[0])
+    if command == 'jls':
+        jails = [dict(jid=_jid, name=_jls_name(_name)) for _name, _jid in sorted(st['run'].items())]
+        _info = {'jail': jails} if jails else {}
+        print(json.dumps({'__version': '2', 'jail-information': _info}))
+        return 0
+    if command == 'zfs':
+        if 'org.freebsd.ioc:active' in args:
+            print("zroot\tyes")
+        elif args[-1] == 'zroot/iocage':
+            print(iocroot())
+        return 0
+    if command == 'jexec':
+        _args = args[1:]
+        if _args[0] == '-u':
+            _args = _args[2:]
+        if _host_target(st, _args[0]) is None:
+            print(f'jexec: jail "{_args[0]}" not found', file=sys.stderr)
+            return 1
+        proc = subprocess.run(_args[1:], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        sys.stdout.write(proc.stdout)
+        sys.stderr.write(proc.stderr)
+        return proc.returncode
+    if command == 'pkg' and args[1] == '-j':
+        name = _host_target(st, args[2])
+        if name is None:
+            print(f"pkg: jail '{args[2]}' not found", file=sys.stderr)
+            return 1
+        return _pkg(st, [name] + args[3:])
+    print(f"{command}: not found", file=sys.stderr)
+    return 127
+
+
+def host(args):
+    '''Run the host command args in this process. Return rc, stdout, stderr.'''
+
+    with _call_lock:
+        _stdout, _stderr = sys.stdout, sys.stderr
+        out, err = io.StringIO(), io.StringIO()
+        sys.stdout, sys.stderr = out, err
+        try:
+            with open(os.path.join(state_dir(), 'lock'), 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                st = _load()
+                try:
+                    rc = _host(st, args)
+                finally:
+                    _save(st)
+        finally:
+            sys.stdout, sys.stderr = _stdout, _stderr
+        return rc, out.getvalue(), err.getvalue()
+
+
+def call(args):
+    '''Run the iocage command args in this process. The calls are serialized. Return rc, stdout,
+       stderr.'''
+
+    with _call_lock:
+        _stdout, _stderr = sys.stdout, sys.stderr
+        out, err = io.StringIO(), io.StringIO()
+        sys.stdout, sys.stderr = out, err
+        try:
+            rc = main(args)
+        finally:
+            sys.stdout, sys.stderr = _stdout, _stderr
+        return rc, out.getvalue(), err.getvalue()
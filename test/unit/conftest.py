@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Fixtures of the unit tests. The fixture sim runs the module on the simulator test/sim/iocage_sim.py.'''
+
+import json
+import os
+import shlex
+import sys
+
+import pytest
+
+pytest.importorskip('ansible')
+
+from ansible.module_utils import basic  # noqa: E402
+from ansible.module_utils._text import to_bytes, to_text  # noqa: E402
+
+try:
+    # ansible-core 2.19 and later need the serialization profile of the arguments
+    from ansible.module_utils.testing import patch_module_args  # noqa: E402
+except ImportError:
+    patch_module_args = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'test', 'sim'))
+
+import iocage  # noqa: E402
+import iocage_sim  # noqa: E402
+
+
+class ModuleExit(Exception):
+    '''Result of exit_json or fail_json.'''
+
+    def __init__(self, result):
+        super().__init__(result)
+        self.result = result
+
+
+@pytest.fixture
+def sim(tmp_path, monkeypatch):
+    '''Run the module on the simulator. Return the function run(n, args, running, check_mode, populate,
+       host, plugins) that returns the result and the list of the iocage calls. plugins=True adds n
+       running plugins. Only iocage is installed on
+       the host unless the host commands host (see iocage_sim.HOST_BINS) are given. Their calls are kept
+       in run.host_calls. The argument spec of the module is kept in run.argument_spec.'''
+
+    monkeypatch.setenv('IOCAGE_SIM_STATE', str(tmp_path))
+    calls = []
+    host_calls = []
+    bins = set()
+    spec = {}
+    _init = basic.AnsibleModule.__init__
+
+    def init(self, argument_spec=None, **kwargs):
+        spec.update(argument_spec or {})
+        _init(self, argument_spec=argument_spec, **kwargs)
+
+    def run_command(self, args, **kwargs):
+        argv = shlex.split(to_text(args))
+        if os.path.basename(argv[0]) == 'iocage':
+            calls.append(' '.join(argv[1:]))
+            return iocage_sim.call(argv[1:])
+        if os.path.basename(argv[0]) in bins:
+            host_calls.append(' '.join([os.path.basename(argv[0])] + argv[1:]))
+            return iocage_sim.host(argv)
+        if argv == ['uname', '-r']:
+            return 0, '13.4-RELEASE-p1\n', ''
+        return 127, '', f"{argv[0]}: not found"
+
+    def get_bin_path(self, name, required=False, opt_dirs=None):
+        if name == 'iocage':
+            return '/usr/local/bin/iocage'
+        return f"/usr/sbin/{name}" if name in bins else None
+
+    def exit_json(self, **kwargs):
+        raise ModuleExit(kwargs)
+
+    def fail_json(self, **kwargs):
+        kwargs['failed'] = True
+        raise ModuleExit(kwargs)
+
+    monkeypatch.setattr(basic.AnsibleModule, '__init__', init)
+    monkeypatch.setattr(basic.AnsibleModule, 'run_command', run_command)
+    monkeypatch.setattr(basic.AnsibleModule, 'get_bin_path', get_bin_path)
+    monkeypatch.setattr(basic.AnsibleModule, 'exit_json', exit_json)
+    monkeypatch.setattr(basic.AnsibleModule, 'fail_json', fail_json)
+
+    def run(n, args, running=False, check_mode=False, populate=True, host=(), plugins=False):
+        if populate:
+            iocage_sim.populate(n, running=running, plugins=n if plugins else 0)
+        iocage._run_cache.clear()
+        del calls[:]
+        del host_calls[:]
+        bins.clear()
+        bins.update(host)
+        _args = dict(args)
+        _args.setdefault('pending_dir', str(tmp_path / 'pending'))
+        if check_mode:
+            _args['_ansible_check_mode'] = True
+        with pytest.raises(ModuleExit) as e:
+            if patch_module_args is not None:
+                with patch_module_args(_args):
+                    iocage.run_module()
+            else:
+                monkeypatch.setattr(basic, '_ANSIBLE_ARGS', to_bytes(json.dumps(dict(ANSIBLE_MODULE_ARGS=_args))))
+                iocage.run_module()
+        return e.value.result, list(calls)
+
+    run.host_calls = host_calls
+    run.argument_spec = spec
+
+    return run
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Budgets of the iocage calls of the module per state.
+
+   AnsibleModule.run_command is replaced by the simulator test/sim/iocage_sim.py running in this
+   process, see the fixture sim in conftest.py. run_module is driven for every state in
+   module_args['state']['choices'] and the sequence of the iocage calls is recorded. The number of
+   the calls must not exceed the budget expressed as a function of the number of jails n. The
+   simulator has n jails j0001..jNNNN and the template tpl.
+
+   shell> python3 -m pytest -q test/unit
+'''
+
+import pytest
+
+pytest.importorskip('ansible')
+
+SIZES = (2, 9)
+MUTATING = ('create', 'clone', 'rename', 'set', 'start', 'stop', 'restart', 'destroy', 'exec', 'pkg',
+            'fetch', 'update')
+
+# Options of the fixture sim: the jails are running, n plugins are running
+UP = dict(running=True)
+PLUGINS = dict(plugins=True)
+
+# id, module arguments, options of the fixture sim, budget(n)
+# A gather of all facts with properties costs n + 5 calls: list -hl, list -hP, list -hlt, list -hr,
+# and get --all for each jail and the template. list -hl lists the plugins too. The parallel start
+# gets the priorities of the n jails, starts them one by one, and lists the jails after each of the
+# 3 tiers of the simulator.
+CASES = [
+    ('facts', dict(state='facts'), {}, lambda n: n + 5),
+    ('facts-minimal', dict(state='facts', gather=['minimal']), {}, lambda n: 0),
+    ('facts-jails', dict(state='facts', gather=['jails']), {}, lambda n: 1),
+    ('facts-compact', dict(state='facts', facts_format='compact'), {}, lambda n: 4),
+    ('facts-projected', dict(state='facts', facts_format='compact', facts_properties=['boot']), {},
+     lambda n: n + 5),
+    ('facts-none', dict(state='facts', facts_format='none'), {}, lambda n: 0),
+    ('facts-plugins', dict(state='facts', gather=['plugins']), PLUGINS, lambda n: 1),
+    ('facts-all-plugins', dict(state='facts'), PLUGINS, lambda n: 2 * n + 5),
+    ('progress', dict(state='progress', progress_file='/nonexistent'), {}, lambda n: 0),
+    ('started', dict(state='started', name='j0001'), {}, lambda n: n + 5 + 3),
+    ('started-minimal', dict(state='started', name='j0001', gather=['minimal']), {}, lambda n: 2 + 2),
+    ('started-up', dict(state='started', name='j0001', gather=['minimal']), UP, lambda n: 2),
+    ('started-all', dict(state='started', name='ALL', gather=['minimal']), {}, lambda n: 2 + 2),
+    ('started-rc', dict(state='started', args='--rc', gather=['minimal']), {}, lambda n: 2 + 2),
+    ('started-rc-parallel', dict(state='started', args='--rc', parallel=True, gather=['minimal']), {},
+     lambda n: 2 + 2 * n + 3),
+    ('started-names', dict(state='started', names=['j0001', 'j0002'], gather=['minimal']), {},
+     lambda n: 2 + 2 + 1),
+    ('stopped', dict(state='stopped', name='j0001', gather=['minimal']), UP, lambda n: 2 + 2),
+    ('stopped-all', dict(state='stopped', name='ALL', gather=['minimal']), UP, lambda n: 2 + 2),
+    ('restarted', dict(state='restarted', name='j0001', gather=['minimal']), UP, lambda n: 2 + 2),
+    ('restarted-all', dict(state='restarted', name='ALL', gather=['minimal']), UP, lambda n: 2 + 2),
+    ('restarted-pending', dict(state='restarted', pending_only=True, gather=['minimal']), UP, lambda n: 2),
+    ('exec', dict(state='exec', name='j0001', cmd='true', gather=['minimal']), UP, lambda n: 3),
+    ('exec-cmds', dict(state='exec', name='j0001', cmds=['true', 'true'], gather=['minimal']), UP,
+     lambda n: 3),
+    ('pkg', dict(state='pkg', name='j0001', cmd='info', gather=['minimal']), UP, lambda n: 3),
+    ('pkg-packages', dict(state='pkg', name='j0001', packages=['pkg', 'nginx'], gather=['minimal']), UP,
+     lambda n: 4),
+    ('get', dict(state='get', name='j0001', gather=['minimal']), {}, lambda n: 3),
+    ('set', dict(state='set', name='j0001', properties=dict(notes='budget'), gather=['minimal']), {},
+     lambda n: 2 + 2 + 2),
+    ('set-bulk', dict(state='set', jail_properties=dict(j0001=dict(notes='a'), j0002=dict(ip4_addr='em0|10.0.0.2/24')),
+                      gather=['minimal']), UP, lambda n: 2 + 2 + 1 + 2 + 1 + 1),
+    ('set-unchanged', dict(state='set', name='j0001', properties=dict(boot=1), gather=['minimal']), {},
+     lambda n: 3),
+    ('absent', dict(state='absent', name='j0001', gather=['minimal']), {}, lambda n: 2 + 1 + 2),
+    ('absent-up', dict(state='absent', name='j0001', gather=['minimal']), UP, lambda n: 2 + 2 + 2),
+    ('cloned', dict(state='cloned', name='new', clone_from='tpl', gather=['minimal']), {},
+     lambda n: 2 + 1 + 2),
+    ('cloned-count', dict(state='cloned', clone_from='tpl', count=3, name_pattern='new%02d',
+                          gather=['minimal']), {}, lambda n: 2 + 3 + 2 + 3),
+    ('present', dict(state='present', name='new', gather=['minimal']), {}, lambda n: 3 + 1 + 2),
+    ('template', dict(state='template', name='new', gather=['minimal']), {}, lambda n: 3 + 1 + 4),
+    ('basejail', dict(state='basejail', name='new', gather=['minimal']), {}, lambda n: 3 + 1 + 2),
+    ('thickjail', dict(state='thickjail', name='new', gather=['minimal']), {}, lambda n: 3 + 1 + 2),
+    ('fetched', dict(state='fetched', release='14.1-RELEASE', gather=['minimal']), {},
+     lambda n: 2 + 1 + 2),
+    ('fetched-exists', dict(state='fetched', release='13.4-RELEASE', gather=['minimal']), {},
+     lambda n: 2),
+    ('fetched-plugin', dict(state='fetched', release='13.4-RELEASE', plugin='nginx', gather=['minimal']), {},
+     lambda n: 2 + 1 + 1),
+    ('fetched-plugin-exists', dict(state='fetched', release='13.4-RELEASE', plugin='p01', gather=['minimal']),
+     PLUGINS, lambda n: 2),
+    ('plan', dict(state='plan', operations=[dict(op='clone', name='new', clone_from='tpl'),
+                                            dict(op='set', name='j0001', properties=dict(notes='plan')),
+                                            dict(op='start', name='j0001')], gather=['minimal']), {},
+     lambda n: 3 + 1),
+]
+
+
+def _mutating(call):
+    _words = call.split()
+    if _words[0] == 'pkg':
+        return _words[2] not in ('query', 'info') and '-n' not in _words
+    return _words[0] in MUTATING
+
+
+def test_every_state_has_budget(sim):
+    states = set(_args['state'] for _id, _args, _options, _budget in CASES)
+    sim(SIZES[0], dict(state='facts', facts_format='none'))
+
+    assert set(sim.argument_spec['state']['choices']) <= states
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('case', CASES, ids=[_case[0] for _case in CASES])
+def test_call_budget(sim, case, n):
+    _id, args, options, budget = case
+    result, calls = sim(n, args, **options)
+
+    assert not result.get('failed'), result.get('msg')
+    assert len(calls) <= budget(n), calls
+
+
+@pytest.mark.parametrize('case', CASES, ids=[_case[0] for _case in CASES])
+def test_check_mode_read_only(sim, case):
+    _id, args, options, budget = case
+    result, calls = sim(SIZES[0], args, check_mode=True, **options)
+
+    assert not result.get('failed'), result.get('msg')
+    assert len(calls) <= budget(SIZES[0]), calls
+    assert not [_call for _call in calls if _mutating(_call)], calls
+
+
+def test_exec_sequence(sim):
+    result, calls = sim(9, dict(state='exec', name='j0001', cmd='true', gather=['minimal']), running=True)
+
+    assert calls == ['list -hl', 'list -hlt', 'exec -u root j0001 -- true']
+
+
+def test_facts_properties_linear(sim):
+    result, calls = sim(9, dict(state='facts'))
+
+    assert len([_call for _call in calls if _call.startswith('get --all')]) == 9 + 1
+    assert len(calls) == len(set(calls))
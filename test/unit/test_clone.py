@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Unit tests of the states cloned and present.
+   The module runs on the simulator, see the fixture sim in conftest.py.
+
+   shell> python3 -m pytest -q test/unit
+'''
+
+import pytest
+
+pytest.importorskip('ansible')
+
+import iocage_sim  # noqa: E402
+
+
+def test_cloned_count_existing(sim):
+    result, calls = sim(3, dict(state='cloned', clone_from='tpl', count=4, name_pattern='j%04d',
+                                properties=dict(notes='z'), gather=['jails', 'properties']))
+
+    assert not result.get('failed'), result.get('msg')
+    assert result['created'] == ['j0004']
+    assert dict((_name, _jail['properties']['notes']) for _name, _jail in
+                result['ansible_facts']['iocage_jails'].items()) == dict(j0001='z', j0002='z', j0003='z', j0004='z')
+
+
+@pytest.mark.parametrize('args', [dict(state='cloned', name='new', clone_from='tpl'),
+                                  dict(state='cloned', name='j0001', clone_from='tpl'),
+                                  dict(state='present', name='new')], ids=['cloned', 'cloned-exists', 'present'])
+def test_single_not_created(sim, args):
+    result, calls = sim(3, dict(args, gather=['minimal']))
+
+    assert not result.get('failed'), result.get('msg')
+    assert 'created' not in result
+
+
+@pytest.mark.parametrize('pkglist, create', [
+    (None, 'create -n new -t tpl'),
+    ('/tmp/pkglist.json', 'create -n new -t tpl -p /tmp/pkglist.json ip4_addr=em0|10.0.0.9/24 notes=offline'),
+], ids=['offline', 'pkglist'])
+def test_cloned_properties_writer_config(sim, pkglist, create):
+    args = dict(state='cloned', name='new', clone_from='tpl', pkglist=pkglist, properties_writer='config',
+                iocroot=iocage_sim.iocroot(), properties=dict(ip4_addr='em0|10.0.0.9/24', notes='offline'),
+                gather=['jails', 'properties'])
+    result, calls = sim(3, args)
+
+    assert not result.get('failed'), result.get('msg')
+    assert [_call for _call in calls if _call.startswith('create')] == [create]
+    assert result['ansible_facts']['iocage_jails']['new']['properties']['notes'] == 'offline'
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Unit tests of the facts: the projection of the properties and the deltas.
+   The module runs on the simulator, see the fixture sim in conftest.py.
+
+   shell> python3 -m pytest -q test/unit
+'''
+
+import pytest
+
+pytest.importorskip('ansible')
+
+import iocage_sim  # noqa: E402
+
+
+def test_facts_properties_projection(sim):
+    result, calls = sim(9, dict(state='facts', facts_format='compact', facts_properties=['boot', 'notes']))
+    jails = result['ansible_facts']['iocage_jails']
+
+    assert sorted(jails) == ['j%04d' % _index for _index in range(1, 10)]
+    assert all(_jail['properties'] == dict(boot='1', notes='none') for _jail in jails.values())
+    assert all('-' not in _jail.values() and 'name' not in _jail for _jail in jails.values())
+
+
+def test_facts_since_delta(sim, tmp_path):
+    args = dict(state='facts', gather=['minimal', 'jails', 'templates'], facts_cache_dir=str(tmp_path / 'cache'))
+    result, calls = sim(9, dict(args, facts_since=''))
+    since = result['iocage_delta']['fingerprint']
+
+    assert result['iocage_delta']['full']
+    assert len(result['ansible_facts']['iocage_jails']) == 9
+
+    iocage_sim.call(['start', 'j0002'])
+    result, calls = sim(9, dict(args, facts_since=since), populate=False)
+    delta = result['iocage_delta']
+
+    assert not delta['full'] and delta['since'] == since and delta['fingerprint'] != since
+    assert list(delta['jails']['changed']) == ['j0002'] and delta['jails']['removed'] == []
+    assert 'templates' not in delta
+    assert 'iocage_jails' not in result['ansible_facts']
+
+    result, calls = sim(9, dict(args, facts_since=delta['fingerprint']), populate=False)
+
+    assert result['iocage_delta'] == dict(full=False, fingerprint=delta['fingerprint'], since=delta['fingerprint'])
+
+
+def test_facts_since_new_section(sim, tmp_path):
+    args = dict(state='facts', gather=['minimal', 'jails'], facts_cache_dir=str(tmp_path / 'cache'))
+    result, calls = sim(9, dict(args, facts_since=''))
+    since = result['iocage_delta']['fingerprint']
+
+    result, calls = sim(9, dict(args, gather=['minimal', 'jails', 'templates'], facts_since=since), populate=False)
+
+    assert result['iocage_delta']['full']
+    assert len(result['ansible_facts']['iocage_jails']) == 9
+    assert list(result['ansible_facts']['iocage_templates']) == ['tpl']
+
+    result, calls = sim(9, dict(args, facts_since=result['iocage_delta']['fingerprint']), populate=False)
+
+    assert not result['iocage_delta']['full'] and 'iocage_jails' not in result['ansible_facts']
+
+
+def test_facts_plugins(sim):
+    result, calls = sim(2, dict(state='facts', gather=['plugins']), plugins=True)
+    plugins = result['ansible_facts']['iocage_plugins']
+
+    assert calls == ['list -hP']
+    assert sorted(plugins) == ['p01', 'p02']
+    assert plugins['p01'] == dict(jid='1', name='p01', boot='off', state='up', type='pluginv2', release='13.4-RELEASE',
+                                  ip4='vnet0|10.0.1.1/24', ip6='-', template='-', portal='http://10.0.1.1',
+                                  doc_url='https://www.freshports.org/p01')
+
+
+@pytest.mark.parametrize('host, probe', [((), ['list -h']), (iocage_sim.HOST_BINS, [])], ids=['list', 'jls'])
+def test_facts_cache_run_state(sim, tmp_path, host, probe):
+    args = dict(gather=['jails'], facts_cache=True, facts_cache_dir=str(tmp_path / 'cache'))
+    result, calls = sim(3, dict(args, state='facts'), running=True, host=host)
+
+    assert calls == ['list -hl']
+
+    iocage_sim.call(['stop', 'j0001'])
+    result, calls = sim(3, dict(args, state='facts'), populate=False, host=host)
+    jails = result['ansible_facts']['iocage_jails']
+
+    assert calls == probe
+    assert (jails['j0001']['state'], jails['j0001']['jid']) == ('down', '-') and jails['j0002']['state'] == 'up'
+
+    result, calls = sim(3, dict(args, state='started', name='j0001'), populate=False, host=host)
+
+    assert result['changed'] and 'start j0001' in calls
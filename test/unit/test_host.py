@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Unit tests of the host tools jls, jexec, pkg -j, and zfs.
+   The module runs on the simulator, see the fixture sim in conftest.py.
+
+   shell> python3 -m pytest -q test/unit
+'''
+
+import pytest
+
+pytest.importorskip('ansible')
+
+import iocage_sim  # noqa: E402
+
+
+def test_host_jls_probe(sim):
+    result, calls = sim(9, dict(state='started', name='j0001', gather=['minimal']), host=iocage_sim.HOST_BINS)
+
+    assert calls == ['list -hl', 'list -hlt', 'start j0001']
+    assert sim.host_calls == ['jls --libxo json jid name']
+    assert result['ansible_facts']['iocage_jails']['j0001']['state'] == 'up'
+
+    result, calls = sim(9, dict(state='stopped', names=['j0001', 'j0002'], gather=['minimal']), running=True,
+                        host=iocage_sim.HOST_BINS)
+
+    assert sorted(calls[2:]) == ['stop j0001', 'stop j0002']
+    assert [result['ansible_facts']['iocage_jails'][_name]['state'] for _name in ('j0001', 'j0002', 'j0003')] == \
+        ['down', 'down', 'up']
+
+
+def test_host_jexec(sim):
+    args = dict(state='exec', name='j0002', cmds=['true', 'echo ok'], exec_backend='jexec', gather=['minimal'])
+    result, calls = sim(9, args, running=True, host=iocage_sim.HOST_BINS)
+
+    assert calls == ['list -hl', 'list -hlt']
+    assert len(sim.host_calls) == 1 and sim.host_calls[0].startswith('jexec -u root 2 /bin/sh -c ')
+    assert [_command['stdout'] for _command in result['commands']] == ['', 'ok\n']
+
+    result, calls = sim(9, dict(args, exec_backend='iocage'), running=True, host=iocage_sim.HOST_BINS)
+
+    assert len(calls) == 3 and calls[2].startswith('exec -u root j0002 -- /bin/sh -c ')
+    assert sim.host_calls == []
+
+
+def test_host_pkg(sim):
+    args = dict(state='pkg', name='j0001', packages=['pkg', 'nginx'], exec_backend='jexec', gather=['minimal'])
+    result, calls = sim(9, args, running=True, host=iocage_sim.HOST_BINS)
+
+    assert not result.get('failed'), result.get('msg')
+    assert result['changed'] and calls == ['list -hl', 'list -hlt']
+    assert [_call.split()[3] for _call in sim.host_calls] == ['query', 'install']
+
+
+def test_host_zfs_iocroot(sim):
+    args = dict(state='facts', gather=['jails', 'properties'], properties_backend='config')
+    result, calls = sim(9, args, host=iocage_sim.HOST_BINS)
+
+    assert calls == ['list -hl']
+    assert sim.host_calls == ['zfs get -H -o name,value org.freebsd.ioc:active',
+                              'zfs get -H -o value mountpoint zroot/iocage']
+    assert result['ansible_facts']['iocage_jails']['j0001']['properties']['host_hostuuid'] == 'j0001'
+
+    result, calls = sim(9, args)
+
+    assert len([_call for _call in calls if _call.startswith('get --all')]) == 9
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Unit tests of the functions of the module iocage that do not need the iocage CLI.
+
+   shell> python3 -m pytest -q test/unit
+'''
+
+import hashlib
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('ansible')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+
+import iocage  # noqa: E402
+
+
+class ModuleExit(Exception):
+    '''Result of exit_json or fail_json.'''
+
+    def __init__(self, result):
+        super().__init__(result)
+        self.result = result
+
+
+class FakeModule(object):
+    '''Minimal AnsibleModule. Commands are answered by the dictionary commands {cmd: (rc, out, err)}.'''
+
+    def __init__(self, params=None, commands=None, bins=None):
+        self.params = dict(properties_backend='cli', facts_workers=1, max_parallel=1)
+        self.params.update(params or {})
+        self.commands = commands or {}
+        self.bins = bins or {}
+        self.check_mode = False
+
+    def run_command(self, cmd, **kwargs):
+        cmd = cmd.decode() if isinstance(cmd, bytes) else cmd
+        return self.commands.get(cmd, (127, '', f"{cmd}: not found"))
+
+    def get_bin_path(self, name, required=False, opt_dirs=None):
+        return self.bins.get(name)
+
+    def fail_json(self, **kwargs):
+        kwargs['failed'] = True
+        raise ModuleExit(kwargs)
+
+
+@pytest.fixture(autouse=True)
+def run_cache():
+    iocage._run_cache.clear()
+    yield
+    iocage._run_cache.clear()
+
+
+def _jails(**properties):
+    return dict((_name, dict(state='down', properties=dict(priority=str(_priority), depends=_depends)))
+                for _name, (_priority, _depends) in properties.items())
+
+
+def test_tiers_priority_and_depends():
+    jails = _jails(a=(10, 'b'), b=(20, 'none'), c=(20, 'none'), d=(30, 'none'))
+    names = sorted(jails)
+
+    assert iocage._jails_tiers(FakeModule(), 'iocage', jails, 'started', names) == \
+        [(20, ['b', 'c']), (20, ['a']), (30, ['d'])]
+    assert iocage._jails_tiers(FakeModule(), 'iocage', jails, 'stopped', names) == \
+        [(30, ['d']), (20, ['a']), (20, ['b', 'c'])]
+
+
+def test_tiers_depends_in_tier():
+    jails = _jails(a=(10, 'none'), b=(10, 'a'), c=(10, 'b'), d=(5, 'none'))
+
+    assert iocage._jails_tiers(FakeModule(), 'iocage', jails, 'started', sorted(jails)) == \
+        [(5, ['d']), (10, ['a']), (10, ['b']), (10, ['c'])]
+
+
+def test_tiers_circular():
+    jails = _jails(a=(10, 'b'), b=(20, 'a'))
+
+    with pytest.raises(ModuleExit) as e:
+        iocage._jails_tiers(FakeModule(), 'iocage', jails, 'started', sorted(jails))
+    assert 'Circular dependency' in e.value.result['msg']
+
+
+JLS = '/usr/sbin/jls --libxo json jid name'
+JLS_OUT = ('{"__version": "2", "jail-information": {"jail": [{"jid": 3, "name": "ioc-foo"}, '
+           '{"jid": 7, "name": "ioc-bar_baz"}, {"jid": 9}]}}')
+
+
+def test_probe():
+    module = FakeModule(commands={JLS: (0, JLS_OUT, '')}, bins=dict(jls='/usr/sbin/jls'))
+
+    assert iocage._jails_probe(module) == {'ioc-foo': '3', 'ioc-bar_baz': '7'}
+
+
+def test_probe_none_running():
+    module = FakeModule(commands={JLS: (0, '{"__version": "2", "jail-information": {}}', '')},
+                        bins=dict(jls='/usr/sbin/jls'))
+
+    assert iocage._jails_probe(module) == {}
+
+
+@pytest.mark.parametrize('bins, result', [
+    ({}, None),
+    (dict(jls='/usr/sbin/jls'), (1, '', 'jls: unknown option')),
+    (dict(jls='/usr/sbin/jls'), (0, 'jid name', '')),
+    (dict(jls='/usr/sbin/jls'), (0, '{"jail-information": []}', '')),
+    (dict(jls='/usr/sbin/jls'), (0, '{"jail-information": {"jail": null}}', '')),
+], ids=['no-jls', 'rc', 'not-json', 'not-dict', 'null'])
+def test_probe_unavailable(bins, result):
+    module = FakeModule(commands={JLS: result}, bins=bins)
+
+    assert iocage._jails_probe(module) is None
+
+
+def test_state_refresh_probe():
+    module = FakeModule(commands={JLS: (0, JLS_OUT, '')}, bins=dict(jls='/usr/sbin/jls'))
+    facts = dict(iocage_jails=dict(foo=dict(state='down', jid='-'), bar=dict(state='up', jid='5'),
+                                   **{'bar.baz': dict(state='down', jid='-')}))
+
+    jails = iocage._jails_state_refresh(module, 'iocage', facts)
+
+    assert jails['foo'] == dict(state='up', jid='3')
+    assert jails['bar'] == dict(state='down', jid='-')
+    assert jails['bar.baz'] == dict(state='up', jid='7')
+
+
+def test_jail_started_fallback():
+    rows = '-\tfoo\tdown\t13.4-RELEASE\t-\n3\tbar\tup\t13.4-RELEASE\t-\n'
+    module = FakeModule(commands={JLS: (0, 'garbage', ''), 'iocage list -h': (0, rows, '')},
+                        bins=dict(jls='/usr/sbin/jls'))
+
+    assert iocage.jail_started(module, 'iocage', 'bar') is True
+    assert iocage.jail_started(module, 'iocage', 'foo') is False
+    assert iocage.jail_started(module, 'iocage', 'baz') is None
+
+
+FETCH = (r"import sys, time; "
+         r"[sys.stdout.write('Fetching: base.txz %d%%\r' % _p) or sys.stdout.flush() or time.sleep(0.05) "
+         r"for _p in (10, 50, 100)]; "
+         r"print('\nExtracting: base.txz'); sys.stderr.write('warning\n'); print('done')")
+
+
+def test_stream_progress(tmp_path):
+    progress_file = str(tmp_path / 'progress.jsonl')
+    cmd = f"{sys.executable} -c \"{FETCH}\""
+
+    rc, out, err = iocage._run_command_stream(FakeModule(), cmd, progress_file)
+
+    assert rc == 0
+    assert out.endswith('Extracting: base.txz\ndone\n') and err == 'warning\n'
+    progress = iocage.progress_read(FakeModule(), progress_file)
+    assert progress['cmd'] == cmd and progress['done'] and progress['rc'] == 0
+    assert progress['phase'] == 'extract' and progress['percent'] is None and progress['lines'] == 6
+
+
+def test_stream_rc(tmp_path):
+    rc, out, err = iocage._run_command_stream(FakeModule(), f"{sys.executable} -c \"import sys; sys.exit(3)\"",
+                                              str(tmp_path / 'progress.jsonl'))
+
+    assert (rc, out, err) == (3, '', '')
+
+
+def test_stream_progress_file_invalid(tmp_path):
+    with pytest.raises(ModuleExit) as e:
+        iocage._run_command_stream(FakeModule(), 'true', str(tmp_path / 'missing' / 'progress.jsonl'))
+    assert e.value.result['msg'].startswith('Unable to write progress_file')
+
+
+def test_stream_not_found():
+    with pytest.raises(ModuleExit) as e:
+        iocage._run_command_stream(FakeModule(), '/nonexistent/iocage fetch', None, 'tail:2')
+    assert 'not executed' in e.value.result['msg']
+
+
+OUTPUT = b'line1\nline2\nline3\nline4\npartial'
+
+
+@pytest.mark.parametrize('chunks', [[OUTPUT], [OUTPUT[:8], OUTPUT[8:13], OUTPUT[13:]]], ids=['one', 'split'])
+@pytest.mark.parametrize('output, stdout, truncated', [
+    ('full', OUTPUT.decode(), None),
+    ('tail:2', 'line4\npartial', True),
+    ('tail:10', OUTPUT.decode(), False),
+    ('summary', '', None),
+], ids=['full', 'tail', 'tail-all', 'summary'])
+def test_output_sink(output, stdout, truncated, chunks):
+    write, close = iocage._output_sink(FakeModule(), output)
+    for _chunk in chunks:
+        write('stdout', _chunk)
+    write('stderr', b'error\n')
+
+    out, err, summary = close()
+
+    assert out == stdout
+    assert err == ('' if output == 'summary' else 'error\n')
+    assert (summary['stdout_lines'], summary['stdout_bytes'], summary['stderr_lines']) == (5, len(OUTPUT), 1)
+    assert summary.get('truncated') == truncated
+
+
+def test_output_sink_file(tmp_path):
+    path = str(tmp_path / 'output.log')
+    write, close = iocage._output_sink(FakeModule(), f"file:{path}")
+    write('stdout', OUTPUT)
+    write('stderr', b'error\n')
+
+    out, err, summary = close()
+
+    assert (out, err) == ('', '')
+    assert summary['file'] == path and summary['stdout_lines'] == 5
+    with open(path, 'rb') as f:
+        assert f.read() == OUTPUT + b'error\n'
+
+
+def test_output_sink_file_invalid(tmp_path):
+    with pytest.raises(ModuleExit) as e:
+        iocage._output_sink(FakeModule(), f"file:{tmp_path / 'missing' / 'output.log'}")
+    assert e.value.result['msg'].startswith('Unable to write the output')
+
+
+RELEASE = '14.1-RELEASE'
+COMPONENTS = dict(base=b'base component', lib32=b'lib32 component')
+
+
+def _mirror(tmp_path, digests=None):
+    '''Create the mirror tmp_path/mirror/RELEASE with the COMPONENTS and their MANIFEST.'''
+
+    mirror = tmp_path / 'mirror'
+    (mirror / RELEASE).mkdir(parents=True)
+    manifest = []
+    for _name, _content in COMPONENTS.items():
+        (mirror / RELEASE / f"{_name}.txz").write_bytes(_content)
+        _digest = (digests or {}).get(_name, hashlib.sha256(_content).hexdigest())
+        manifest.append(f"{_name}.txz\t{_digest}\t100\t{_name}\t\"{_name}\"\ton\n")
+    (mirror / RELEASE / 'MANIFEST').write_text(''.join(manifest))
+    return mirror
+
+
+def _cache_module(tmp_path, mirror):
+    return FakeModule(params=dict(state='fetched', components_cache=str(tmp_path / 'cache'),
+                                  components_mirror=mirror))
+
+
+def test_components_cache_file_url(tmp_path):
+    mirror = _mirror(tmp_path)
+
+    root, components = iocage.release_components_cache(_cache_module(tmp_path, f"file://{mirror}"), RELEASE)
+
+    assert root == str(tmp_path / 'cache' / 'releases') and components == ['base.txz', 'lib32.txz']
+    for _name, _content in COMPONENTS.items():
+        _link = tmp_path / 'cache' / 'releases' / RELEASE / f"{_name}.txz"
+        assert _link.read_bytes() == _content
+        assert os.path.samefile(str(_link), str(tmp_path / 'cache' / 'sha256' / hashlib.sha256(_content).hexdigest()))
+    assert (tmp_path / 'cache' / 'releases' / RELEASE / 'MANIFEST').is_file()
+
+
+def test_components_cache_verified(tmp_path):
+    mirror = _mirror(tmp_path)
+    iocage.release_components_cache(_cache_module(tmp_path, str(mirror)), RELEASE, ['base.txz'])
+    (mirror / RELEASE / 'base.txz').unlink()
+    _link = tmp_path / 'cache' / 'releases' / RELEASE / 'base.txz'
+    _inode = _link.stat().st_ino
+
+    root, components = iocage.release_components_cache(_cache_module(tmp_path, str(mirror)), RELEASE, ['base.txz'])
+
+    assert components == ['base.txz'] and _link.stat().st_ino == _inode
+
+
+def test_components_cache_sha256_mismatch(tmp_path):
+    mirror = _mirror(tmp_path, digests=dict(lib32='0' * 64))
+
+    with pytest.raises(ModuleExit) as e:
+        iocage.release_components_cache(_cache_module(tmp_path, str(mirror)), RELEASE)
+    assert "doesn't match MANIFEST" in e.value.result['msg']
+    assert sorted(os.listdir(str(tmp_path / 'cache' / 'sha256'))) == [hashlib.sha256(COMPONENTS['base']).hexdigest()]
+
+
+def test_components_cache_unwritable(tmp_path):
+    mirror = _mirror(tmp_path)
+    (tmp_path / 'cache').write_text('')
+
+    with pytest.raises(ModuleExit) as e:
+        iocage.release_components_cache(_cache_module(tmp_path, str(mirror)), RELEASE)
+    assert e.value.result['msg'].startswith(f"Unable to populate components_cache {tmp_path / 'cache'} with {RELEASE}")
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Unit tests of the state pkg with packages.
+   The module runs on the simulator, see the fixture sim in conftest.py.
+
+   shell> python3 -m pytest -q test/unit
+'''
+
+import pytest
+
+pytest.importorskip('ansible')
+
+import iocage_sim  # noqa: E402
+
+
+@pytest.mark.parametrize('outdated, install', [
+    ([], None),
+    (['nginx'], 'pkg j0001 install -y nginx'),
+], ids=['up-to-date', 'outdated'])
+def test_pkg_latest(sim, outdated, install):
+    iocage_sim.populate(2, running=True)
+    iocage_sim.call(['pkg', 'j0001', 'install', '-y', 'nginx', 'curl'])
+    iocage_sim.outdated('j0001', outdated)
+    args = dict(state='pkg', name='j0001', packages=['nginx', 'misc/curl'], package_state='latest',
+                gather=['minimal'])
+    result, calls = sim(2, args, populate=False)
+
+    assert not result.get('failed'), result.get('msg')
+    assert calls[2:4] == ['pkg j0001 query %n %o', 'pkg j0001 version -R -l <']
+    assert calls[4:] == ([install] if install else [])
+    assert result['changed'] == bool(install)
+
+
+def test_pkg_latest_missing(sim):
+    args = dict(state='pkg', name='j0001', packages=['pkg', 'nginx'], package_state='latest', gather=['minimal'])
+    result, calls = sim(2, args, running=True)
+
+    assert result['changed']
+    assert calls[2:] == ['pkg j0001 query %n %o', 'pkg j0001 version -R -l <', 'pkg j0001 install -y nginx']
+
+    result, calls = sim(2, dict(args, packages=['nginx']), populate=False)
+
+    assert not result['changed'] and 'install -y nginx' not in ' '.join(calls)
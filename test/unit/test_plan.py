@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Unit tests of the state plan.
+   The module runs on the simulator, see the fixture sim in conftest.py.
+
+   shell> python3 -m pytest -q test/unit
+'''
+
+import pytest
+
+pytest.importorskip('ansible')
+
+import iocage_sim  # noqa: E402
+
+
+def test_plan(sim, tmp_path):
+    operations = [dict(op='fetch', release='14.1-RELEASE'),
+                  dict(op='create', name='new', release='14.1-RELEASE'),
+                  dict(op='set', name='j0001', properties=dict(host_hostname='b')),
+                  dict(op='start', name='j0002'),
+                  dict(op='set', name='j0002', properties=dict(ip4_addr='em0|10.0.0.2/24', boot=1)),
+                  dict(op='absent', name='j0003')]
+    args = dict(state='plan', operations=operations, gather=['minimal'], facts_cache=True,
+                facts_cache_dir=str(tmp_path / 'cache'), properties_backend='config', iocroot=iocage_sim.iocroot())
+    result, calls = sim(9, args)
+
+    assert not result['changed']
+    assert calls == ['list -hl', 'list -hlt', 'list -hr']
+    assert [(_result['changed'], _result['cmd']) for _result in result['plan']] == [
+        (True, ['/usr/local/bin/iocage fetch  -r 14.1-RELEASE']),
+        (True, ['/usr/local/bin/iocage create -n new -r 14.1-RELEASE']),
+        (True, ['/usr/local/bin/iocage set host_hostname="b"  j0001']),
+        (True, ['/usr/local/bin/iocage start j0002']),
+        (True, ['/usr/local/bin/iocage stop j0002', '/usr/local/bin/iocage set ip4_addr="em0|10.0.0.2/24"  j0002',
+                '/usr/local/bin/iocage start j0002']),
+        (True, ['/usr/local/bin/iocage destroy --force j0003'])]
+
+    result, calls = sim(9, args, populate=False)
+
+    assert calls == ['list -h']
+    assert result['msg'] == "6 of 6 operations would change."
+
+    result, calls = sim(9, dict(args, operations=[dict(op='stop', name='nonexistent')]), populate=False)
+
+    assert result['failed'] and result['plan'][0]['failed']
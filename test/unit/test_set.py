@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2021, Vladimir Botka <vbotka@gmail.com>
+# SPDX-License-Identifier: BSD-2-Clause
+
+'''Unit tests of the state set: the bulk properties, the restart modes, and the writers.
+   The module runs on the simulator, see the fixture sim in conftest.py.
+
+   shell> python3 -m pytest -q test/unit
+'''
+
+import json
+import os
+import threading
+
+import pytest
+
+pytest.importorskip('ansible')
+
+import iocage  # noqa: E402
+import iocage_sim  # noqa: E402
+
+
+def test_set_bulk_restart(sim):
+    jail_properties = dict(j0001=dict(notes='a'), j0002=dict(ip4_addr='em0|10.0.0.2/24'), j0003=dict(boot='on'))
+    result, calls = sim(9, dict(state='set', jail_properties=jail_properties, gather=['minimal']), running=True)
+    jails = result['jails']
+
+    assert [_call for _call in calls if _call.split()[0] in ('stop', 'start')] == ['stop j0002', 'start j0002']
+    assert jails['j0002']['restart'] and not jails['j0001']['restart']
+    assert jails['j0001']['properties'] == dict(notes='a')
+    assert not jails['j0003']['changed']
+    assert result['ansible_facts']['iocage_jails']['j0002']['state'] == 'up'
+
+
+def test_restart_deferred(sim):
+    args = dict(state='set', restart='deferred', gather=['minimal'])
+    result, calls = sim(9, dict(args, name='j0001', properties=dict(ip4_addr='em0|10.0.0.1/24')), running=True)
+
+    assert result['pending'] == ['j0001']
+    assert not [_call for _call in calls if _call.split()[0] in ('stop', 'start', 'restart')]
+
+    result, calls = sim(9, dict(args, jail_properties=dict(j0001=dict(vnet=1), j0002=dict(host_hostname='b'))),
+                        populate=False)
+
+    assert result['pending'] == ['j0001', 'j0002']
+    assert result['jails']['j0002']['restart'] == 'deferred'
+
+    result, calls = sim(9, dict(state='restarted', pending_only=True, gather=['minimal']), populate=False)
+
+    assert sorted(_call for _call in calls if _call.startswith('restart')) == ['restart j0001', 'restart j0002']
+    assert result['pending'] == []
+
+
+def test_restart_deferred_main_thread(sim, tmp_path, monkeypatch):
+    threads = []
+    _pending_write = iocage._pending_write
+
+    def pending_write(module, name, properties):
+        threads.append(threading.current_thread() is threading.main_thread())
+        return _pending_write(module, name, properties)
+
+    monkeypatch.setattr(iocage, '_pending_write', pending_write)
+    args = dict(state='set', restart='deferred', max_parallel=4, gather=['minimal'],
+                jail_properties=dict((_name, dict(vnet=1)) for _name in ('j0001', 'j0002', 'j0003', 'j0004')))
+    result, calls = sim(9, args, running=True)
+
+    assert result['pending'] == ['j0001', 'j0002', 'j0003', 'j0004'] and threads == [True] * 4
+
+    (tmp_path / 'file').write_text('')
+    result, calls = sim(9, dict(args, pending_dir=str(tmp_path / 'file' / 'pending')), running=True)
+
+    assert result['failed'] and result['msg'].startswith("Unable to record the pending restart of the jail 'j0001'")
+
+
+def test_restart_soft(sim):
+    result, calls = sim(9, dict(state='set', name='j0001', properties=dict(host_hostname='a'), restart='soft',
+                                gather=['minimal']), running=True)
+
+    assert [_call for _call in calls if _call.split()[0] in ('stop', 'start', 'restart')] == ['restart -s j0001']
+
+    result, calls = sim(9, dict(state='set', name='j0001', properties=dict(host_hostname='b', vnet=1), restart='soft',
+                                gather=['minimal']), populate=False)
+
+    assert [_call for _call in calls if _call.split()[0] in ('stop', 'start', 'restart')] == \
+        ['stop j0001', 'start j0001']
+
+
+def test_properties_writer_config(sim):
+    args = dict(state='set', name='j0001', properties=dict(notes='offline', priority=5, template='yes'),
+                properties_writer='config', iocroot=iocage_sim.iocroot(), gather=['minimal'])
+    result, calls = sim(9, args)
+    path = os.path.join(iocage_sim.iocroot(), 'templates', 'j0001', 'config.json')
+
+    assert [_call for _call in calls if _call.split()[0] == 'set'] == ['set template=1 j0001']
+    with open(path) as f:
+        config = json.load(f)
+    assert config['notes'] == 'offline' and config['priority'] == 5 and config['template'] == 1
+    assert os.path.exists(path + '.bak')
+
+    result, calls = sim(9, dict(args, name='j0002', properties=dict(notes='online')), running=True)
+
+    assert [_call for _call in calls if _call.split()[0] == 'set'] == ['set notes=online j0002']
+
+
+@pytest.mark.parametrize('args', [dict(state='set'), dict(state='cloned', clone_from='tpl', count=3)],
+                         ids=['set', 'cloned'])
+def test_jail_properties_not_dict(sim, args):
+    result, calls = sim(2, dict(args, jail_properties=dict(j0001=dict(notes='a'), j0002='bad'), gather=['minimal']))
+
+    assert result['failed'] and result['msg'] == "jail_properties of the jail 'j0002' must be a dictionary"
+    assert not [_call for _call in calls if _call.split()[0] in ('set', 'create')]